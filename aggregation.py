@@ -0,0 +1,165 @@
+import datetime
+
+import numpy as np
+from sqlalchemy import select, func, Date
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+from database import DB
+from db_pyqt.core import Table
+
+
+class day(FunctionElement):
+    type = Date()
+    inherit_cache = True
+
+
+@compiles(day)
+def compile_day(element, compiler, **kwargs):
+    return 'CAST(%s AS DATE)' % compiler.process(element.clauses, **kwargs)
+
+
+@compiles(day, 'sqlite')
+def compile_sqlite_day(element, compiler, **kwargs):
+    return 'date(%s)' % compiler.process(element.clauses, **kwargs)
+
+
+def to_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value[:10])
+    return value
+
+
+class HyperLogLog:
+    precision = 12  # 4096 регистров, погрешность около 1.6%
+    size = 1 << precision
+
+    @staticmethod
+    def hash(keys):
+        x = np.asarray(keys, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)  # splitmix64
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+    @classmethod
+    def sketches(cls, keys, indices, length):
+        hashes = cls.hash(keys)
+        bits = 64 - cls.precision
+        registers = (hashes >> np.uint64(bits)).astype(np.intp)
+        rest = (hashes & np.uint64((1 << bits) - 1)).astype(float)  # до 52 бит, точно в float64
+        ranks = (bits + 1 - np.frexp(rest)[1]).astype(np.uint8)
+        sketches = np.zeros((length, cls.size), dtype=np.uint8)
+        np.maximum.at(sketches, (np.asarray(indices, dtype=np.intp), registers), ranks)
+        return sketches
+
+    @classmethod
+    def estimate(cls, sketches):
+        m = cls.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.exp2(-sketches.astype(float)), axis=-1)
+        zeros = np.count_nonzero(sketches == 0, axis=-1)
+        small = (raw <= 2.5 * m) & (zeros > 0)
+        linear = m * np.log(m / np.maximum(zeros, 1))
+        return np.where(small, linear, raw)
+
+    @classmethod
+    def new_per_day(cls, sketches, days):
+        # оценка числа различных ключей с начала промежутка, разложенная по дням. sketches -
+        # пары (номер дня, регистры) по возрастанию дня, в памяти только один накопленный вектор
+        running = np.zeros(cls.size, dtype=np.uint8)
+        totals = np.zeros(days)
+        previous, total = 0, 0.0
+        for index, registers in sketches:
+            totals[previous:index] = total
+            np.maximum(running, registers, out=running)
+            previous, total = index, cls.estimate(running)
+        totals[previous:] = total
+        return np.diff(totals, prepend=0)
+
+
+class DailyStatistics:
+    def __init__(self, start_date, end_date):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.days = max((end_date - start_date).days, 0)
+
+    @property
+    def start_datetime(self):
+        return datetime.datetime.combine(self.start_date, datetime.time())
+
+    @property
+    def end_datetime(self):
+        return datetime.datetime.combine(self.end_date, datetime.time())
+
+    @property
+    def utilization(self):
+        return Table('Utilization').declarative_meta
+
+    @property
+    def order(self):
+        return Table('Order').declarative_meta
+
+    @property
+    def service_to_order(self):
+        return Table('ServiceToOrder').declarative_meta
+
+    def in_range(self, column):
+        return column >= self.start_datetime, column < self.end_datetime
+
+    def in_date_range(self, column):
+        return column >= self.start_date, column < self.end_date
+
+    def histogram(self, query):
+        return self.bins(DB.current_session.execute(query).all())
+
+    def day_indices(self, dates):
+        return np.array([(to_date(date) - self.start_date).days for date in dates], dtype=int)
+
+    def bins(self, rows):
+        if not rows:
+            return np.zeros(self.days)
+        dates, counts = zip(*rows)
+        indices = self.day_indices(dates)
+        counts = np.array(counts, dtype=float)
+        inside = (indices >= 0) & (indices < self.days)
+        return np.bincount(indices[inside], weights=counts[inside], minlength=self.days)
+
+    def utilizations_per_day(self):
+        started = day(self.utilization.StartDatetime)
+        query = select(started, func.count()).where(
+            *self.in_range(self.utilization.StartDatetime)
+        ).group_by(started)
+        return self.histogram(query)
+
+    def clients_per_day(self):
+        created = day(self.order.CreationDate)
+        query = select(created, func.count(self.order.ClientId.distinct())).where(
+            *self.in_date_range(self.order.CreationDate)
+        ).group_by(created)
+        return self.histogram(query)
+
+    def new_clients_per_day(self):
+        first_order = select(func.min(day(self.order.CreationDate)).label('first')).where(
+            *self.in_date_range(self.order.CreationDate)
+        ).group_by(self.order.ClientId).subquery()
+        query = select(first_order.c.first, func.count()).group_by(first_order.c.first)
+        return self.histogram(query)
+
+    def new_orders_per_day(self):
+        first_utilization = select(func.min(day(self.utilization.StartDatetime)).label('first')).join(
+            self.service_to_order, self.service_to_order.Id == self.utilization.ServiceToOrderId
+        ).where(
+            *self.in_range(self.utilization.StartDatetime)
+        ).group_by(self.service_to_order.OrderId).subquery()
+        query = select(first_utilization.c.first, func.count()).group_by(first_utilization.c.first)
+        return self.histogram(query)
+
+    def series(self):
+        utilizations = np.cumsum(self.utilizations_per_day())
+        clients = np.cumsum(self.new_clients_per_day())
+        clients_per_day = self.clients_per_day()
+        orders = np.cumsum(self.new_orders_per_day())
+        results = np.divide(utilizations, orders, out=np.zeros(self.days), where=orders > 0)
+        return [utilizations, clients, clients_per_day, results]
@@ -0,0 +1,189 @@
+import datetime
+import functools
+import hashlib
+import hmac
+import os
+import threading
+
+from sqlalchemy import select, func, update, insert, delete
+from sqlalchemy.exc import IntegrityError
+
+from database import DB
+from db_pyqt.core import Table
+
+ALGORITHM = 'pbkdf2_sha256'
+ITERATIONS = 200000  # стоимость хэша, увеличивать со временем
+SALT_BYTES = 16
+BUCKET = datetime.timedelta(minutes=5)  # неудачные попытки считаются по интервалам
+WINDOW = datetime.timedelta(minutes=30)  # сколько интервалов учитывается
+CAPTCHA_AFTER = 2  # неудачных попыток до капчи
+LOCK_AFTER = 10  # неудачных попыток до блокировки логина на WINDOW
+
+
+def hash_password(password, salt=None, iterations=ITERATIONS):
+    salt = os.urandom(SALT_BYTES) if salt is None else salt
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+    return f'{ALGORITHM}${iterations}${salt.hex()}${digest.hex()}'
+
+
+def verify_password(password, stored):
+    # возвращает (пароль верен, нужно ли пересохранить хэш)
+    if stored is None:
+        return False, False
+    if not stored.startswith(ALGORITHM + '$'):
+        correct = hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8'))  # пароль в открытом виде
+        return correct, correct
+    _, iterations, salt, digest = stored.split('$')
+    expected = hash_password(password, bytes.fromhex(salt), int(iterations)).split('$')[-1]
+    correct = hmac.compare_digest(expected, digest)
+    return correct, correct and int(iterations) < ITERATIONS
+
+
+@functools.cache
+def dummy_hash():
+    return hash_password('', b'\0' * SALT_BYTES)  # для одинакового времени ответа на неизвестный логин
+
+
+def bucket(moment):
+    return moment - (moment - datetime.datetime.min) % BUCKET
+
+
+class Attempts:
+    # Неудачные входы по логину и интервалу времени. Хранятся в таблице LoginAttempt
+    # (см. data/optimizations.sql), без нее - в памяти этого рабочего места.
+    memory = {}
+    lock = threading.Lock()
+
+    @staticmethod
+    def stored():
+        return 'LoginAttempt' in DB.base.classes
+
+    @classmethod
+    def failures(cls, login, now=None):
+        since = bucket(now or datetime.datetime.now()) - WINDOW + BUCKET
+        if not cls.stored():
+            with cls.lock:
+                return sum(count for (name, start), count in cls.memory.items() if name == login and start >= since)
+        attempt = Table('LoginAttempt').declarative_meta
+        query = select(func.sum(attempt.Failures)).where(attempt.Login == login, attempt.Bucket >= since)
+        with DB.new_session as session:
+            return session.scalar(query) or 0
+
+    @classmethod
+    def fail(cls, login, now=None):
+        start = bucket(now or datetime.datetime.now())
+        if not cls.stored():
+            with cls.lock:
+                for key in [key for key in cls.memory if key[1] < start - WINDOW]:
+                    cls.memory.pop(key)
+                cls.memory[login, start] = cls.memory.get((login, start), 0) + 1
+            return
+        attempt = Table('LoginAttempt').declarative_meta
+        increment = update(attempt).where(attempt.Login == login, attempt.Bucket == start).values(
+            Failures=attempt.Failures + 1
+        )
+        with DB.new_session as session:
+            if session.execute(increment).rowcount == 0:
+                try:
+                    session.execute(insert(attempt).values(Login=login, Bucket=start, Failures=1))
+                except IntegrityError:  # строку успело создать другое рабочее место
+                    session.rollback()
+                    session.execute(increment)
+            session.commit()
+
+    @classmethod
+    def clear(cls, login):
+        if not cls.stored():
+            with cls.lock:
+                for key in [key for key in cls.memory if key[0] == login]:
+                    cls.memory.pop(key)
+            return
+        attempt = Table('LoginAttempt').declarative_meta
+        with DB.new_session as session:
+            session.execute(delete(attempt).where(attempt.Login == login))
+            session.commit()
+
+
+def locked(failures):
+    return failures >= LOCK_AFTER
+
+
+def upgrade_password(user, password):
+    column = Table('User').declarative_meta.__table__.c.Password
+    new_hash = hash_password(password)
+    if column.type.length is not None and column.type.length < len(new_hash):
+        return  # столбец слишком короткий для хэша, см. data/optimizations.sql
+    model = Table('User').declarative_meta
+    with DB.new_session as session:
+        session.execute(update(model).where(model.Id == user.Id).values(Password=new_hash))
+        session.commit()
+
+
+def authenticate(login, password):
+    # возвращает (пользователь или None, число неудачных попыток за WINDOW)
+    failures = Attempts.failures(login)
+    if locked(failures):
+        return None, failures
+    user = Table('User').get(Login=login).first()
+    correct, outdated = verify_password(password, user.Password if user is not None else dummy_hash())
+    if user is None or not correct:
+        Attempts.fail(login)
+        return None, failures + 1
+    if outdated:
+        upgrade_password(user, password)
+    if failures:
+        Attempts.clear(login)
+    return user, 0
+
+
+def permissions_query(user_id):
+    user = Table('User').declarative_meta
+    user_type = Table('UserType').declarative_meta
+    service_to_user = Table('ServiceToUser').declarative_meta
+    service = Table('Service').declarative_meta
+    return select(user_type.Name, service.Name).select_from(user).join(
+        user_type, user_type.Id == user.TypeId
+    ).outerjoin(
+        service_to_user, service_to_user.UserId == user.Id
+    ).outerjoin(
+        service, service.Id == service_to_user.ServiceId
+    ).where(user.Id == user_id).order_by(service_to_user.Id)
+
+
+class Permissions:
+    users = {}  # User.Id -> (UserType.Name, он же класс меню, названия назначенных услуг)
+    tables = ('User', 'UserType', 'ServiceToUser', 'Service')  # сбрасывают кэш только записи в эти таблицы
+    generation = None
+    lock = threading.Lock()
+
+    @classmethod
+    def cached(cls, user):
+        with cls.lock:
+            if cls.generation != DB.generation_of(*cls.tables):
+                cls.users.clear()
+                cls.generation = DB.generation_of(*cls.tables)
+            return cls.users.get(user.Id)
+
+    @classmethod
+    def resolve(cls, user):
+        cached = cls.cached(user)
+        if cached is not None:
+            return cached
+        generation = DB.generation_of(*cls.tables)
+        rows = DB.current_session.execute(permissions_query(user.Id)).all()
+        type_name = rows[0][0] if rows else None
+        services = tuple(name for _, name in rows if name is not None)
+        with cls.lock:
+            if generation == DB.generation_of(*cls.tables):
+                cls.users[user.Id] = type_name, services
+        return type_name, services
+
+
+DB.caches.append(Permissions.users)
+
+
+def log_in(login, password):
+    user, failures = authenticate(login, password)
+    if user is not None:
+        Permissions.resolve(user)  # меню строится из кэша без запросов в потоке интерфейса
+    return user, failures
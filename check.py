@@ -1,15 +1,17 @@
-import csv
-
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QDateTimeEdit, QFileDialog
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QDateTimeEdit, QFileDialog, QDateEdit, QComboBox, \
+    QPushButton, QProgressDialog, QMessageBox
 
+import invoice
+import reporting
+from db_pyqt.executor import executor
 from db_pyqt.forms import Choose, Dialog, Form
-from pdf import Canvas
 
 
 class Check(QWidget):
-    def __init__(self, services):
+    def __init__(self, client_id):
         super().__init__()
-        self.services = services
+        self.client_id = client_id
         self.title = 'Формировать счет'
         self.start = QDateTimeEdit()
         self.end = QDateTimeEdit()
@@ -20,49 +22,26 @@ class Check(QWidget):
         self.layout().addLayout(time_range_layout)
 
     @property
-    def data(self):
-        services = []
-        total_price = 0
-        for service in self.services:
-            services.append(f'{service.Name} {service.Price}')
-            total_price += service.Price
-        data = [
-            f'период для оплаты: {self.start.text()}-{self.end.text()}',
-            'список оказанных услуг и цен:' + '\n'.join(services),
-            'стоимостью услуг общая: ' + str(total_price)
-        ]
-        return data
+    def period(self):
+        return self.start.dateTime().toPyDateTime().date(), self.end.dateTime().toPyDateTime().date()
 
     def validate(self):
         return True
 
-    def save_to_csv(self, path):
-        with open(path, 'w+', encoding='utf-8') as file:
-            writer = csv.writer(file)
-            for line in self.data:
-                writer.writerow([line])
-
-    def save_to_pdf(self, path):
-        canvas = Canvas(path)
-        for i, line in enumerate(self.data):
-            canvas.drawString(0, i * 20, line)
-        canvas.save()
-
     def perform(self):
         filter_sting = 'pdf file (*.pdf);;csv file (*.csv)'
         path, _ = QFileDialog.getSaveFileName(self, self.title, filter=filter_sting)
         if path:
-            extension = path.split('.')[-1]
-            methods = {'csv': self.save_to_csv, 'pdf': self.save_to_pdf}
-            methods[extension](path)
+            executor.submit(
+                self, reporting.invoice_report, path, *self.period, self.client_id,
+                callback=self.saved, errback=self.failed
+            )
 
+    def saved(self, path):  # выгрузка идет в фоне и может закончиться после закрытия формы
+        QMessageBox.information(self, self.title, f'Счет сохранен: {path}')
 
-def get_services(client):
-    services = []
-    for order in client.order_collection:
-        for service_to_order in order.servicetoorder_collection:
-            services.append(service_to_order.service)
-    return services
+    def failed(self, error):
+        QMessageBox.warning(self, self.title, f'Ошибка формирования счета: {error}')
 
 
 class EntityCheck(Choose):
@@ -75,11 +54,11 @@ class EntityCheck(Choose):
         Dialog(form, parent)
 
     @property
-    def services(self):
-        return []
+    def client_id(self):
+        return None
 
     def perform(self):
-        Dialog(Form(Check(self.services)), self.parent())
+        Dialog(Form(Check(self.client_id)), self.parent())
 
     @property
     def title(self):
@@ -91,8 +70,8 @@ class PhysicalEntityCheck(EntityCheck):
         super().__init__('клиенту', 'Client', parent)
 
     @property
-    def services(self):
-        return get_services(self.selected_instance)
+    def client_id(self):
+        return self.selected_instance.Id
 
 
 class LegalEntityCheck(EntityCheck):
@@ -100,5 +79,78 @@ class LegalEntityCheck(EntityCheck):
         super().__init__('предприятию', 'Insurance', parent)
 
     @property
-    def services(self):
-        return get_services(self.selected_instance.client)
+    def client_id(self):
+        return self.selected_instance.client.Id
+
+
+class BatchCheck(QWidget):
+    kinds = {'клиентам': 'Client', 'предприятиям': 'Insurance'}
+    progressed = pyqtSignal(int, int)  # из рабочего потока в поток интерфейса
+
+    def __init__(self):
+        super().__init__()
+        QVBoxLayout(self)
+        self.progress = None
+        self.stopped = False
+        self.progressed.connect(self.update_progress)
+        self.start = QDateEdit()
+        self.end = QDateEdit()
+        self.kind_combobox = QComboBox()
+        self.format_combobox = QComboBox()
+        self.button = QPushButton('Формировать')
+
+        self.kind_combobox.addItems(list(self.kinds))
+        self.format_combobox.addItems(list(invoice.WRITERS))
+        self.button.clicked.connect(self.form)
+
+        time_range_layout = QHBoxLayout()
+        time_range_layout.addWidget(self.start)
+        time_range_layout.addWidget(self.end)
+        self.layout().addLayout(time_range_layout)
+        self.layout().addWidget(self.kind_combobox)
+        self.layout().addWidget(self.format_combobox)
+        self.layout().addWidget(self.button)
+
+    def form(self):
+        directory = QFileDialog.getExistingDirectory(self, 'Папка для счетов')
+        if directory:
+            batch = invoice.Batch(
+                self.kinds[self.kind_combobox.currentText()],
+                self.start.date().toPyDate(),
+                self.end.date().toPyDate(),
+                directory,
+                self.format_combobox.currentText()
+            )
+            self.stopped = False
+            self.progress = QProgressDialog('Формирование счетов', 'Остановить', 0, 0, self)
+            self.progress.setWindowModality(Qt.WindowModal)
+            self.progress.canceled.connect(self.stop)
+            self.progress.show()
+            self.button.setDisabled(True)
+            executor.submit(
+                self, batch.run, self.progressed.emit, lambda: self.stopped,
+                callback=self.finished, errback=self.failed
+            )
+
+    def stop(self):
+        self.stopped = True
+
+    def update_progress(self, done, total):
+        if self.progress is not None:
+            self.progress.setMaximum(total)
+            self.progress.setValue(done)
+
+    def close_progress(self):
+        self.progress.close()
+        self.progress = None
+        self.button.setDisabled(False)
+
+    def finished(self, manifest):
+        self.close_progress()
+        if manifest['failed']:
+            errors = '\n'.join(f'{name}: {error}' for name, error in manifest['failed'].items())
+            QMessageBox.warning(self, 'Формирование счетов', f'Не сформированы счета:\n{errors}')
+
+    def failed(self, error):
+        self.close_progress()
+        QMessageBox.warning(self, 'Формирование счетов', f'Ошибка формирования счетов: {error}')
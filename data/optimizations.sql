@@ -0,0 +1,45 @@
+-- Рекомендуемые индексы для базы данных приложения (SQL Server).
+
+-- Поиск в таблицах (db_pyqt.table.Table.page_query) строит цепочку LEFT JOIN
+-- по внешним ключам, поэтому каждый внешний ключ должен быть проиндексирован.
+CREATE INDEX IX_Order_ClientId ON [Order] (ClientId);
+CREATE INDEX IX_ServiceToOrder_OrderId ON ServiceToOrder (OrderId);
+CREATE INDEX IX_ServiceToOrder_ServiceId ON ServiceToOrder (ServiceId);
+CREATE INDEX IX_Utilization_ServiceToOrderId ON Utilization (ServiceToOrderId);
+CREATE INDEX IX_ServiceToUser_UserId ON ServiceToUser (UserId);
+
+-- Фильтр таблицы ищет подстроку (LIKE '%текст%'), поиск по индексу невозможен. Строковые
+-- столбцы сравниваются без CAST и функций, поэтому сервер сканирует узкий индекс, а не всю таблицу.
+CREATE INDEX IX_Client_Email ON Client (Email);
+CREATE INDEX IX_Client_Phone ON Client (Phone);
+
+-- Отчет (aggregation.DailyStatistics) выбирает строки по диапазону дат.
+CREATE INDEX IX_Order_CreationDate ON [Order] (CreationDate) INCLUDE (ClientId);
+CREATE INDEX IX_Utilization_StartDatetime ON Utilization (StartDatetime) INCLUDE (ServiceToOrderId);
+
+-- Идентификаторы новых записей (db_pyqt.table.Allocator). Если последовательность
+-- <Таблица><Столбец>Sequence существует, каждое рабочее место резервирует блок из
+-- 20 значений, иначе предлагается MAX(столбец) + 1. INCREMENT BY должен совпадать
+-- с Allocator.block.
+DECLARE @sql nvarchar(max);
+SELECT @sql = N'CREATE SEQUENCE OrderIdSequence AS int START WITH '
+    + CAST(ISNULL(MAX(Id), 0) + 1 AS nvarchar(20)) + N' INCREMENT BY 20' FROM [Order];
+EXEC (@sql);
+SELECT @sql = N'CREATE SEQUENCE ServiceToOrderIdSequence AS int START WITH '
+    + CAST(ISNULL(MAX(Id), 0) + 1 AS nvarchar(20)) + N' INCREMENT BY 20' FROM ServiceToOrder;
+EXEC (@sql);
+
+-- Вход (auth.authenticate) ищет пользователя по логину, пароль проверяется по хэшу
+-- pbkdf2_sha256$<итерации>$<соль>$<хэш> (около 120 символов). Пароли в открытом виде
+-- заменяются хэшем при первом успешном входе, если столбец достаточно длинный.
+CREATE UNIQUE INDEX IX_User_Login ON [User] (Login);
+ALTER TABLE [User] ALTER COLUMN Password nvarchar(200) NOT NULL;
+
+-- Неудачные попытки входа по 5-минутным интервалам, общие для всех рабочих мест.
+-- Без этой таблицы попытки считаются в памяти каждого рабочего места.
+CREATE TABLE LoginAttempt (
+    Login nvarchar(100) NOT NULL,
+    Bucket datetime2 NOT NULL,
+    Failures int NOT NULL,
+    CONSTRAINT PK_LoginAttempt PRIMARY KEY (Login, Bucket)
+);
@@ -1,6 +1,12 @@
-from sqlalchemy import text, create_engine, select, join, orm
+import os
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import text, create_engine, select, join, orm, make_url, event
 from sqlalchemy.ext.automap import automap_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.orm import sessionmaker, Session, scoped_session
+
+import reflection
 
 
 class Descriptor:
@@ -11,25 +17,139 @@ class Descriptor:
         return self.function()
 
 
+class Lazy:
+    def __init__(self, function):
+        self.function = function
+        self.name = function.__name__
+
+    def __get__(self, instance, owner):
+        if self.name not in owner.state:
+            with owner.lock:
+                if self.name not in owner.state:
+                    owner.state[self.name] = self.function(owner)
+        return owner.state[self.name]
+
+
 class ReusableSession(Session):
 
     def commit(self) -> None:
         super().commit()
-        DB.current_session = DB.new_session
+        DB.changed(self.info.pop('written', ()))
 
     def rollback(self) -> None:
         super().rollback()
-        DB.current_session = DB.new_session
+        DB.changed(self.info.pop('written', ()))
+
+
+@event.listens_for(ReusableSession, 'after_flush')
+def remember_flushed(session, flush_context):
+    written = session.info.setdefault('written', set())
+    for instance in (*session.new, *session.deleted):
+        written.add(instance.__table__.name)
+    for instance in session.dirty:
+        if session.is_modified(instance):
+            written.add(instance.__table__.name)
+
+
+@event.listens_for(ReusableSession, 'do_orm_execute')
+def remember_executed(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        written = orm_execute_state.session.info.setdefault('written', set())
+        written.add(orm_execute_state.statement.table.name)
 
 
 class DB:
     server = '(localdb)\\server'  # имя mssql сервера
     db = 'Test'  # имя базы данных
     driver = 'ODBC+Driver+17+for+SQL+Server'
-    url = f'mssql://@{server}/{db}?trusted_connection=yes&driver={driver}'
-    engine = create_engine(url)
-    base = automap_base()
-    base.prepare(engine)
-    get_session = sessionmaker(engine)
-    new_session = Descriptor(get_session)
-    current_session = ReusableSession(engine)
+    url = os.environ.get('DB_URL', f'mssql://@{server}/{db}?trusted_connection=yes&driver={driver}')
+    pool_size = 5  # постоянных соединений на одно рабочее место
+    max_overflow = 5
+    pool_timeout = 30  # секунд ожидания свободного соединения
+    pool_recycle = 1800  # секунд до переподключения
+    pool_pre_ping = True
+    fast_executemany = True  # пакетные INSERT одним вызовом ODBC, см. forms.BulkAdd
+    state = {}  # создается при первом обращении, см. Lazy
+    caches = []  # очищаются при DB.configure
+    lock = threading.RLock()
+    generation = 0  # увеличивается при каждом commit/rollback, сбрасывает кэши
+    table_generations = {}  # имя таблицы -> число завершенных транзакций, писавших в нее
+
+    @Lazy
+    def engine(cls):
+        url = make_url(cls.url)
+        if url.get_backend_name() == 'sqlite':
+            return create_engine(url)
+        options = {}
+        if url.get_driver_name() == 'pyodbc':
+            options['fast_executemany'] = cls.fast_executemany
+        return create_engine(
+            url,
+            pool_size=cls.pool_size,
+            max_overflow=cls.max_overflow,
+            pool_timeout=cls.pool_timeout,
+            pool_recycle=cls.pool_recycle,
+            pool_pre_ping=cls.pool_pre_ping,
+            **options
+        )
+
+    @Lazy
+    def base(cls):
+        base = automap_base(metadata=reflection.load_metadata(cls.engine))
+        base.prepare()
+        return base
+
+    @Lazy
+    def get_session(cls):
+        return sessionmaker(cls.engine, class_=ReusableSession)
+
+    @Lazy
+    def sessions(cls):
+        return scoped_session(cls.get_session)  # одна сессия на поток
+
+    new_session = Descriptor(lambda: DB.get_session())
+    current_session = Descriptor(lambda: DB.sessions())
+
+    @staticmethod
+    @contextmanager
+    def session_scope():
+        session = DB.sessions()
+        try:
+            yield session
+            session.commit()
+        except BaseException:
+            session.rollback()
+            raise
+        finally:
+            DB.sessions.remove()
+
+    @classmethod
+    def changed(cls, tables):
+        with cls.lock:
+            cls.generation += 1
+            for table in tables:
+                cls.table_generations[table] = cls.table_generations.get(table, 0) + 1
+
+    @classmethod
+    def generation_of(cls, *tables):
+        return tuple(cls.table_generations.get(table, 0) for table in tables)
+
+    @classmethod
+    def configure(cls, url=None, engine=None):
+        cls.dispose()
+        if url is not None:
+            cls.url = url
+        if engine is not None:
+            cls.url = engine.url.render_as_string(hide_password=False)
+            cls.state['engine'] = engine
+
+    @classmethod
+    def dispose(cls):
+        with cls.lock:
+            if 'sessions' in cls.state:
+                cls.state['sessions'].remove()
+            if 'engine' in cls.state:
+                cls.state['engine'].dispose()
+            cls.state.clear()
+            for cache in cls.caches:
+                cache.clear()
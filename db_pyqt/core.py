@@ -0,0 +1,287 @@
+import datetime
+import threading
+
+from sqlalchemy import inspect, select, cast, case, String, func, Sequence
+from sqlalchemy.dialects.mssql import MONEY, SMALLMONEY
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.orm import Relationship, RelationshipProperty
+
+from database import DB
+from .utilities import camel_to_normal
+
+
+LIKE_WILDCARDS = {'mssql': '%_['}  # в SQL Server [...] - набор символов
+
+
+def escape_like(text, dialect_name=None):
+    text = text.replace('\\', '\\\\')
+    for character in LIKE_WILDCARDS.get(dialect_name, '%_'):
+        text = text.replace(character, '\\' + character)
+    return text
+
+
+def python_type(column):
+    try:
+        return column.type.python_type
+    except NotImplementedError:
+        return None
+
+
+class as_text(FunctionElement):
+    # значение столбца в том же виде, что str(value) в таблице
+    type = String()
+    inherit_cache = True
+
+
+def boolean_text(column):
+    return case((column == True, 'True'), (column == False, 'False'))  # noqa: E712, как str(bool)
+
+
+@compiles(as_text)
+def compile_as_text(element, compiler, **kwargs):
+    column = list(element.clauses)[0]
+    if python_type(column) is bool:
+        return compiler.process(boolean_text(column), **kwargs)
+    return compiler.process(cast(column, String), **kwargs)
+
+
+MSSQL_FORMATS = {  # тип, стиль CONVERT: yyyy-mm-dd hh:mi:ss, как str(datetime)
+    datetime.datetime: ('varchar(19)', 120),
+    datetime.date: ('varchar(10)', 23),
+    datetime.time: ('varchar(8)', 108)
+}
+
+
+@compiles(as_text, 'mssql')
+def compile_mssql_as_text(element, compiler, **kwargs):
+    column = list(element.clauses)[0]
+    value = compiler.process(column, **kwargs)
+    if python_type(column) is bool:
+        return compiler.process(boolean_text(column), **kwargs)
+    if python_type(column) in MSSQL_FORMATS:
+        text_type, style = MSSQL_FORMATS[python_type(column)]
+        return f'CONVERT({text_type}, {value}, {style})'
+    if isinstance(column.type, (MONEY, SMALLMONEY)):  # pyodbc возвращает money с 4 знаками после точки
+        return f'CONVERT(varchar(30), {value}, 2)'
+    return f'CAST({value} AS varchar(50))'
+
+
+class Table:
+    initialized = {}
+    lock = threading.RLock()
+    collation = None  # например 'Cyrillic_General_CI_AS' для поиска без учета регистра на стороне сервера
+
+    def __new__(cls, name, *args, **kwargs):
+        table = cls.initialized.get(name)
+        if table is None:
+            with cls.lock:
+                table = cls.initialized.get(name)
+                if table is None:
+                    table = super().__new__(cls)
+                    table.build(name)
+                    cls.initialized[name] = table
+        return table
+
+    def __init__(self, name):
+        pass
+
+    def build(self, name):
+        self.declarative_meta = getattr(DB.base.classes, name)
+        self.primary_key = inspect(self.declarative_meta).primary_key[0]
+        native_columns = []
+        foreign_columns = []
+        joins = []
+
+        for column in self.columns:
+            if column.foreign_keys:
+                for foreign_key in column.foreign_keys:
+                    target_column = foreign_key.column
+                    target_table = self.__class__(target_column.table.name)
+                    foreign_columns.extend(target_table.recursive_columns)
+                    joins.append((target_table.declarative_meta, target_column == column))
+            else:
+                native_columns.append(column)
+
+        self.native_columns = tuple(native_columns)
+        self.foreign_columns = tuple(foreign_columns)
+        self.recursive_columns = self.native_columns + self.foreign_columns
+        self.joins = tuple(joins)
+        plan_columns, plan_joins = self.join_plan()
+        self.plan_columns = tuple(plan_columns)
+        self.plan_joins = tuple(plan_joins)
+        self.allocators = {}
+
+    @property
+    def name(self):
+        return self.declarative_meta.__table__.name
+
+    @property
+    def relationships(self):
+        return inspect(self.declarative_meta).relationships
+
+    def get_relationships(self, relationship_type):
+        return [i for i in self.relationships if type(i) is relationship_type]
+
+    @property
+    def dependencies(self):
+        return self.get_relationships(Relationship)
+
+    @property
+    def dependants(self):
+        return self.get_relationships(RelationshipProperty)
+
+    def search_conditions(self, columns, patterns, case_sensitive=False):
+        conditions = []
+        for column, pattern in zip(columns, patterns):
+            if pattern:
+                pattern = '%' + escape_like(pattern, DB.engine.dialect.name) + '%'
+                text = column if python_type(column) is str else as_text(column)
+                if case_sensitive:
+                    conditions.append(text.like(pattern, escape='\\'))
+                elif self.collation is not None:
+                    conditions.append(text.collate(self.collation).like(pattern, escape='\\'))
+                elif DB.engine.dialect.name == 'mssql':  # сравнение по умолчанию без учета регистра, без lower()
+                    conditions.append(text.like(pattern, escape='\\'))
+                else:
+                    conditions.append(text.ilike(pattern, escape='\\'))
+        return conditions
+
+    def page_query(self, with_values=False, count=None, after=None, patterns=(), case_sensitive=False):
+        columns, joins = self.plan_columns, self.plan_joins
+        if with_values:
+            query = select(self.primary_key, *columns)
+        else:
+            query = select(self.declarative_meta)
+        query = query.select_from(self.declarative_meta.__table__)
+        for join in joins:
+            query = query.outerjoin(*join)
+        query = query.where(*self.search_conditions(columns, patterns, case_sensitive))
+        if after is not None:
+            query = query.where(self.primary_key > after)
+        return query.order_by(self.primary_key).limit(count)
+
+    def instances(self, count, after=None, patterns=(), case_sensitive=False):
+        query = self.page_query(False, count, after, patterns, case_sensitive)
+        return DB.current_session.scalars(query).all()
+
+    def rows(self, count, after=None, patterns=(), case_sensitive=False):
+        query = self.page_query(True, count, after, patterns, case_sensitive)
+        return [(row[0], list(row[1:])) for row in DB.current_session.execute(query)]
+
+    def join_plan(self, table_clause=None):
+        if table_clause is None:
+            table_clause = self.declarative_meta.__table__
+        columns = [table_clause.c[column.name] for column in self.native_columns]
+        joins = []
+        for column in self.columns:
+            for foreign_key in column.foreign_keys:
+                target_table = Table(foreign_key.column.table.name)
+                alias = target_table.declarative_meta.__table__.alias()
+                joins.append((alias, alias.c[foreign_key.column.name] == table_clause.c[column.name]))
+                sub_columns, sub_joins = target_table.join_plan(alias)
+                columns.extend(sub_columns)
+                joins.extend(sub_joins)
+        return columns, joins
+
+    def data(self, instances):
+        keys = [getattr(instance, self.primary_key.name) for instance in instances]
+        if not keys:
+            return
+        columns, joins = self.plan_columns, self.plan_joins
+        query = select(self.primary_key, *columns).select_from(self.declarative_meta.__table__)
+        for join in joins:
+            query = query.outerjoin(*join)
+        query = query.where(self.primary_key.in_(keys))
+        rows = {row[0]: list(row[1:]) for row in DB.current_session.execute(query)}
+        for key in keys:
+            yield rows[key]
+
+    def values(self, instance):
+        return next(self.data([instance]))
+
+    def get_by_primary_key(self, value):
+        return self.get(**{self.primary_key.name: value}).first()
+
+    @property
+    def columns(self):
+        return self.declarative_meta.__table__.columns
+
+    def recursive_column_names(self, translation_language=None):
+        processors = []
+
+        if len(set([column.table for column in self.recursive_columns])) > 1:
+            processors.append(lambda column: column.table.name + column.name)
+        else:
+            processors.append(lambda column: column.name)
+
+        processors.append(camel_to_normal)
+
+
+
+        names = []
+        for column in self.recursive_columns:
+            result = column
+            for processor in processors:
+                result = processor(result)
+            names.append(result)
+        return names
+
+    def where(self, query, **conditions):
+        where = []
+        for column_name, value in conditions.items():
+            where.append(getattr(self.declarative_meta, column_name) == value)
+        if where:
+            query = query.where(*where)
+        return query
+
+    def get(self, **conditions):
+        return DB.current_session.scalars(self.where(select(self.declarative_meta), **conditions))
+
+    def allocator(self, column_name):
+        if column_name not in self.allocators:
+            with self.lock:
+                self.allocators.setdefault(column_name, Allocator(self, column_name))
+        return self.allocators[column_name]
+
+    def next_value(self, column_name):
+        return self.allocator(column_name).next()
+
+    def next_values(self, column_name, count):
+        return self.allocator(column_name).reserve(count)
+
+    def exists(self, **conditions):
+        query = self.where(select(self.primary_key), **conditions).limit(1)
+        return DB.current_session.scalar(query) is not None
+
+
+DB.caches.append(Table.initialized)
+
+
+class Allocator:
+    block = 20  # должно совпадать с INCREMENT BY последовательности, см. data/optimizations.sql
+
+    def __init__(self, table, column_name):
+        self.column = getattr(table.declarative_meta, column_name)
+        self.sequence = Sequence(table.name + column_name + 'Sequence')
+        self.has_sequence = None
+        self.reserved = []
+        self.lock = threading.Lock()
+
+    def next(self):
+        return self.reserve(1)[0]
+
+    def reserve(self, count):
+        with self.lock:
+            if self.has_sequence is None:
+                self.has_sequence = DB.engine.dialect.supports_sequences and \
+                    inspect(DB.engine).has_sequence(self.sequence.name)
+            if not self.has_sequence:
+                maximum = DB.current_session.scalar(select(func.max(self.column)))
+                start = 0 if maximum is None else maximum + 1
+                return list(range(start, start + count))
+            while len(self.reserved) < count:
+                start = DB.current_session.scalar(select(self.sequence.next_value()))
+                self.reserved.extend(range(start, start + self.block))
+            values, self.reserved = self.reserved[:count], self.reserved[count:]
+            return values
@@ -0,0 +1,89 @@
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from database import DB
+
+
+class Job(QRunnable):
+    def __init__(self, executor, key, function, args, callback, errback):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.executor = executor
+        self.key = key
+        self.function = function
+        self.args = args
+        self.callback = callback
+        self.errback = errback
+        self.cancelled = False
+
+    def run(self):
+        if self.cancelled:
+            return
+        try:
+            result = self.function(*self.args)
+        except Exception as error:
+            self.executor.failed.emit(self, error)
+        else:
+            self.executor.finished.emit(self, result)
+        finally:
+            DB.sessions.remove()
+
+
+class Executor(QObject):
+    finished = pyqtSignal(object, object)
+    failed = pyqtSignal(object, object)
+
+    def __init__(self, max_threads=4):
+        super().__init__()
+        self.pool = QThreadPool()
+        self.pool.setMaxThreadCount(max_threads)
+        self.latest = {}
+        self.finished.connect(self.deliver)
+        self.failed.connect(self.fail)
+
+    def submit(self, key, function, *args, callback=lambda result: None, errback=None):
+        if key is not None:
+            self.cancel(key)
+        job = Job(self, key, function, args, callback, errback)
+        if key is not None:
+            self.latest[key] = job
+        self.pool.start(job)
+        return job
+
+    def cancel(self, key):
+        job = self.latest.pop(key, None)
+        if job is not None:
+            job.cancelled = True
+            self.pool.tryTake(job)
+
+    def done(self, job):
+        if job.cancelled:
+            return False
+        if self.latest.get(job.key) is job:
+            self.latest.pop(job.key)
+        return True
+
+    def deliver(self, job, result):
+        if self.done(job):
+            job.callback(result)
+
+    def fail(self, job, error):
+        if self.done(job):
+            if job.errback is None:
+                raise error
+            job.errback(error)
+
+    def wait(self):
+        self.pool.waitForDone()
+
+
+def __getattr__(name):
+    # пул потоков создается при первом обращении, а не при импорте модуля
+    if name == 'executor':
+        globals()['executor'] = Executor()
+        return globals()['executor']
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def attach(instances):
+    session = DB.current_session
+    return [session.merge(instance, load=False) for instance in instances]
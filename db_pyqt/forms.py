@@ -1,11 +1,17 @@
-from PyQt5.QtCore import QRect
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QPushButton, QLabel
+import datetime
+
+from PyQt5.QtCore import QRect, QTimer, pyqtSignal
+from PyQt5.QtGui import QColor, QKeySequence
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QPushButton, QLabel, QTableWidget, QTableWidgetItem, \
+    QApplication
+from sqlalchemy import insert, select
 
 from database import DB
+from db_pyqt.core import python_type
 from db_pyqt.inputs import Inputs, Input, UniqueInput
-from db_pyqt.table import Table, SearchableTableWidget, TableWidget, Selection
+from db_pyqt.table import Table, SearchableTableWidget, TableWidget, Selection, TableView
 from db_pyqt.utilities import get_primary_and_foreign_key_columns, connect, camel_to_normal
-from db_pyqt.widgets import LeftAlignedLayout, ScrollableDialog
+from db_pyqt.widgets import LeftAlignedLayout, ScrollableDialog, SubStringSearch
 
 
 class Element(QWidget):
@@ -70,7 +76,7 @@ class Edit(Mode):
             if column.name not in column_names_to_inputs:
                 value = getattr(instance, column.name)
                 if column.unique or column.primary_key:
-                    input_ = UniqueInput(column, value)
+                    input_ = UniqueInput(column) if value is None else UniqueInput(column, value)
                 else:
                     input_ = Input(column)
                 if value is not None:
@@ -124,13 +130,16 @@ class Edit(Mode):
 
 
 class Add(Edit):
-    def __init__(self, table_name, **column_names_to_inputs):
+    def __init__(self, table_name, bulk=(), **column_names_to_inputs):
         super().__init__(Table(table_name).declarative_meta(), **column_names_to_inputs)
         self.dependants = []
         for dependant in self.table.dependants:
             primary, foreign = get_primary_and_foreign_key_columns(dependant)
             kwargs = {foreign.name: self.inputs[primary.name]}
-            element = OptionallyAddMultipleInstancesOf(foreign.table.name, **kwargs)
+            if foreign.table.name in bulk:
+                element = BulkAdd(foreign.table.name, **kwargs)
+            else:
+                element = OptionallyAddMultipleInstancesOf(foreign.table.name, **kwargs)
             self.layout().addWidget(element)
             self.dependants.append(element)
             self.connect_validation(element)
@@ -172,6 +181,176 @@ class OptionallyAddMultipleInstancesOf(Mode):
         return Table(self.table_name)
 
 
+BOOLEANS = {'1': True, 'true': True, 'yes': True, 'да': True, '0': False, 'false': False, 'no': False, 'нет': False}
+
+
+def parse(column, text):
+    if text == '':
+        return None
+    value_type = python_type(column)
+    if value_type is None:  # тип без соответствия в Python хранится как введенный текст
+        return text
+    if value_type is bool:
+        if text.lower() not in BOOLEANS:
+            raise ValueError(text)
+        return BOOLEANS[text.lower()]
+    if value_type in (datetime.datetime, datetime.date, datetime.time):
+        return value_type.fromisoformat(text)
+    return value_type(text)
+
+
+class Grid(QTableWidget):
+    pasted = pyqtSignal(int, int, int, int)  # первая строка, первый столбец, строк, столбцов
+
+    def keyPressEvent(self, e) -> None:
+        if e.matches(QKeySequence.Paste):
+            self.paste(QApplication.clipboard().text())
+        else:
+            super().keyPressEvent(e)
+
+    def paste(self, text):
+        top = max(self.currentRow(), 0)
+        left = max(self.currentColumn(), 0)
+        lines = [line.rstrip('\r').split('\t')[:self.columnCount() - left] for line in text.rstrip('\n').split('\n')]
+        self.blockSignals(True)  # одна проверка на всю вставку вместо проверки на каждую ячейку
+        try:
+            self.setRowCount(max(self.rowCount(), top + len(lines)))
+            for i, values in enumerate(lines):
+                for j, value in enumerate(values):
+                    self.setItem(top + i, left + j, QTableWidgetItem(value.strip()))
+        finally:
+            self.blockSignals(False)
+        self.pasted.emit(top, left, len(lines), max(map(len, lines)))
+
+
+class BulkAdd(Mode):
+    invalid_color = QColor(250, 200, 200)
+
+    def __init__(self, table_name, **column_names_to_inputs):
+        self.table_name = table_name
+        self.column_names_to_inputs = column_names_to_inputs
+        super().__init__()
+        self.generated = self.table.primary_key.name if self.table.primary_key.type.python_type is int else None
+        self.columns = [
+            column for column in self.table.columns
+            if column.name not in column_names_to_inputs and column.name != self.generated
+        ]
+        self.rows = []  # строки, готовые к вставке
+        self.errors = set()  # (строка, столбец) с некорректным значением
+
+        self.grid = Grid(0, len(self.columns))
+        self.grid.setHorizontalHeaderLabels([camel_to_normal(column.name) for column in self.columns])
+        self.grid.cellChanged.connect(self.cell_changed)
+        self.grid.pasted.connect(self.pasted)
+        self.error = QLabel('Incorrect input')
+        self.error.hide()
+        self.add_button = QPushButton('+')
+        self.remove_button = QPushButton('-')
+        self.add_button.clicked.connect(self.add)
+        self.remove_button.clicked.connect(self.remove)
+        self.layout().addWidget(self.grid)
+        self.layout().addWidget(self.error)
+        self.layout().addLayout(LeftAlignedLayout(self.add_button, self.remove_button))
+
+    @property
+    def table(self):
+        return Table(self.table_name)
+
+    def add(self):
+        self.grid.insertRow(self.grid.rowCount())
+
+    def remove(self):
+        if self.grid.rowCount():
+            row = self.grid.rowCount() - 1
+            self.grid.removeRow(row)
+            self.errors = {(i, j) for i, j in self.errors if i != row}
+            del self.rows[row:]
+            self.validate()
+
+    def cell_changed(self, row, column_index):
+        if self.load_cell(row, column_index):
+            self.check_references([(row, column_index)])
+        self.validate()
+
+    def pasted(self, top, left, row_count, column_count):
+        loaded = []
+        for row in range(top, top + row_count):
+            for column_index in range(left, left + column_count):
+                if self.grid.item(row, column_index) is not None and self.load_cell(row, column_index):
+                    loaded.append((row, column_index))
+        self.check_references(loaded)
+        self.validate()
+
+    def load_cell(self, row, column_index):
+        while len(self.rows) < self.grid.rowCount():
+            self.rows.append({column.name: None for column in self.columns})
+        column = self.columns[column_index]
+        try:
+            self.rows[row][column.name] = parse(column, self.grid.item(row, column_index).text().strip())
+        except (ValueError, ArithmeticError):  # Decimal сообщает об ошибке через InvalidOperation
+            self.rows[row][column.name] = None
+            self.mark(row, column_index, False)
+            return False
+        self.mark(row, column_index, True)
+        return True
+
+    def mark(self, row, column_index, correct):
+        item = self.grid.item(row, column_index)
+        self.grid.blockSignals(True)  # смена цвета тоже вызывает cellChanged
+        try:
+            if correct:
+                self.errors.discard((row, column_index))
+                item.setBackground(QColor(255, 255, 255))
+            else:
+                self.errors.add((row, column_index))
+                item.setBackground(self.invalid_color)
+        finally:
+            self.grid.blockSignals(False)
+
+    def check_references(self, cells):
+        # значения внешних ключей проверяются одним запросом на столбец
+        values = {}
+        for row, column_index in cells:
+            column = self.columns[column_index]
+            value = self.rows[row][column.name]
+            if column.foreign_keys and value is not None:
+                values.setdefault(column_index, {}).setdefault(value, []).append(row)
+        for column_index, rows_by_value in values.items():
+            target = next(iter(self.columns[column_index].foreign_keys)).column
+            query = select(target).where(target.in_(list(rows_by_value)))
+            existing = set(DB.current_session.scalars(query))
+            for value, rows in rows_by_value.items():
+                if value not in existing:
+                    for row in rows:
+                        self.mark(row, column_index, False)
+
+    @property
+    def filled_rows(self):
+        return [row for row in self.rows if any(value is not None for value in row.values())]
+
+    def _validate(self):
+        result = not self.errors and all(
+            row[column.name] is not None or column.nullable for row in self.filled_rows for column in self.columns
+        )
+        self.error.setHidden(result)
+        return result
+
+    def perform(self):
+        rows = [dict(row) for row in self.filled_rows]
+        if not rows:
+            return
+        for column_name, input_ in self.column_names_to_inputs.items():
+            value = parse(getattr(self.table.declarative_meta, column_name), str(input_.widget.value()))
+            for row in rows:
+                row[column_name] = value
+        if self.generated is not None:
+            for row, value in zip(rows, self.table.next_values(self.generated, len(rows))):
+                row[self.generated] = value
+        session = DB.current_session
+        session.flush()  # родительская запись должна быть вставлена раньше
+        session.execute(insert(self.table.declarative_meta), rows)
+
+
 class Form(Element):
     def __init__(self, *modes: Mode):
         self.modes = modes
@@ -232,6 +411,30 @@ class View(Mode):
             return instances[0]
 
 
+class Browse(Mode):
+    search_delay = 300
+
+    def __init__(self, table_name):
+        self.table_name = table_name
+        super().__init__()
+        self.table_view = TableView(self.table)
+        self.search = SubStringSearch(self.table_view.model().columnCount())
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.search_delay)
+        self.search_timer.timeout.connect(self.perform_search)
+        self.search.connect_to(lambda: self.search_timer.start())
+        self.layout().addWidget(self.search)
+        self.layout().addWidget(self.table_view)
+
+    def perform_search(self):
+        self.table_view.model().search(self.search.patterns)
+
+    @property
+    def table(self):
+        return Table(self.table_name)
+
+
 class Choose(View):
     def __init__(self, table_name):
         self.error = QLabel('No instance is selected')
@@ -278,5 +481,5 @@ class ViewToEdit(View):
             edit_mode = Edit(instance)
             form = Form(edit_mode)
             Dialog(form, self.searchable_table_widget)
-            form.submit_button.clicked.connect(self.searchable_table_widget.table_widget.update)
+            form.submit_button.clicked.connect(self.searchable_table_widget.table_widget.reload)
             return edit_mode
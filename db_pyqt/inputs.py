@@ -1,12 +1,14 @@
 import datetime
 import typing
 
+from PyQt5.QtCore import QTimer
 from PyQt5.QtGui import QValidator
 from PyQt5.QtWidgets import QLineEdit, QSpinBox, QDoubleSpinBox, QDateTimeEdit, QTimeEdit, QDateEdit, QFormLayout, \
     QWidget, QLabel
 from sqlalchemy import Column
 
 from database import DB
+from db_pyqt.executor import executor
 from db_pyqt.table import Table
 from db_pyqt.utilities import connect, camel_to_normal
 
@@ -152,21 +154,29 @@ class Input:
 
 
 class UniqueInput(Input):
+    delay = 300
+    cache_size = 1000
+    known = {}  # (таблица, столбец, значение) -> значение уже занято
+    known_generation = None
+
     def __init__(self, column, *except_values):
         self.except_values = except_values
+        self.pending = None
+        self.timer = QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(self.delay)
+        self.timer.timeout.connect(self.check)
         super().__init__(column)
 
-        if self.python_type is int:
-            instances = self.table.get()
-            maximum = max(map(lambda instance: getattr(instance, column.name), instances), default=-1)
-            self.widget.setValue(maximum + 1)
+        if self.python_type is int and not except_values:  # новая запись, у существующей код уже есть
+            self.widget.setValue(self.table.next_value(column.name))
 
     def set_validate(self):
         old_validate = self.widget.validate
 
         def new_validate(string, pos):
             result = old_validate(string, pos)
-            if result[0] is QValidator.State.Acceptable:
+            if result[0] == QValidator.State.Acceptable:
                 return self.validate_uniqueness(string, pos)
             return result
 
@@ -174,16 +184,71 @@ class UniqueInput(Input):
 
         super().set_validate()
 
+    @property
+    def key(self):
+        return self.table.name, self.column.name
+
+    @classmethod
+    def lookup(cls, key, value):
+        if cls.known_generation != DB.generation:
+            cls.known.clear()
+            cls.known_generation = DB.generation
+        return cls.known.get((*key, value))
+
+    @classmethod
+    def remember(cls, key, value, exists, generation):
+        if generation == DB.generation:
+            if len(cls.known) >= cls.cache_size:
+                cls.known.clear()
+            cls.known[(*key, value)] = exists
+
     def validate_uniqueness(self, string, pos):
         state = QValidator.State.Acceptable
         value = self.widget.valueFromText(string)
-        if (self.column.unique or self.column.primary_key) and value not in self.except_values:
-            conditions = {self.column.name: value}
-            instances = self.table.get(**conditions)
-            if instances.first():
+        self.pending = None
+        if (self.column.unique or self.column.primary_key) and str(value) not in map(str, self.except_values):
+            exists = self.lookup(self.key, value)
+            if exists is None:  # ошибку не показываем, пока идет проверка, форма ждет ее в validate
+                self.pending = value
+                self.timer.start()
+            elif exists:
                 state = QValidator.State.Intermediate
         return state, string, pos
 
+    def validate(self):
+        return super().validate() and self.pending is None
+
+    def check_now(self):
+        # Enter не ждет таймера: значение проверяется сразу
+        if self.pending is not None:
+            self.timer.stop()
+            executor.cancel(self)
+            value = self.pending
+            self.checked(value, *exists(self.table, self.column.name, value, DB.generation))
+
+    def check(self):
+        value = self.pending
+        if value is None:
+            return
+        generation = DB.generation
+        executor.submit(
+            self, exists, self.table, self.column.name, value, generation,
+            callback=lambda result: self.checked(value, *result)
+        )
+
+    def checked(self, value, exists, generation):
+        self.remember(self.key, value, exists, generation)
+        if value == self.pending:
+            self.pending = None
+            self.widget.validate(self.widget.text(), 0)
+
+
+def exists(table, column_name, value, generation):
+    return table.exists(**{column_name: value}), generation
+
+
+DB.caches.append(UniqueInput.known)
+
 
 class Inputs(QWidget):
     def __init__(self, *columns):
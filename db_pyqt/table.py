@@ -1,126 +1,12 @@
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer, pyqtSignal
 from PyQt5.QtGui import QColor
-from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem
-from sqlalchemy import inspect, select
-from sqlalchemy.orm import Relationship, RelationshipProperty
+from PyQt5.QtWidgets import QTableWidget, QTableWidgetItem, QTableView, QPushButton, QWidget, QLabel, QMessageBox, \
+    QApplication
 
 from database import DB
-from .utilities import connect, camel_to_normal
-from .widgets import SmartScrollArea, SubStringSearch
-
-
-class Table:
-    initialized = set()
-
-    def __new__(cls, name, *args, **kwargs):
-        for table in cls.initialized:
-            if table.name == name:
-                return table
-        table = super().__new__(cls)
-        cls.initialized.add(table)
-        return table
-
-    def __init__(self, name):
-        self.declarative_meta = getattr(DB.base.classes, name)
-        self.native_columns = []
-        self.foreign_columns = []
-        self.joins = []
-
-        for column in self.columns:
-            if column.foreign_keys:
-                for foreign_key in column.foreign_keys:
-                    target_column = foreign_key.column
-                    target_table = self.__class__(target_column.table.name)
-                    self.foreign_columns.extend(target_table.recursive_columns)
-                    self.joins.append([target_table.declarative_meta, target_column == column])
-            else:
-                self.native_columns.append(column)
-
-    @property
-    def name(self):
-        return self.declarative_meta.__table__.name
-
-    @property
-    def relationships(self):
-        return inspect(self.declarative_meta).relationships
-
-    def get_relationships(self, relationship_type):
-        return [i for i in self.relationships if type(i) is relationship_type]
-
-    @property
-    def dependencies(self):
-        return self.get_relationships(Relationship)
-
-    @property
-    def dependants(self):
-        return self.get_relationships(RelationshipProperty)
-
-    def instances(self, count):
-        query = DB.current_session.query(self.declarative_meta).select_from(self.declarative_meta)
-        for join in self.joins:
-            query = query.join(*join)
-        query = query.limit(count)
-        return query.all()
-
-    def data(self, instances):
-        for instance in instances:
-            yield self.values(instance)
-
-    def values(self, instance):
-        values = []
-        for column in self.native_columns:
-            values.append(getattr(instance, column.name))
-        for column in self.columns:
-            for foreign_key in column.foreign_keys:
-                value = getattr(instance, column.name)
-                table = Table(foreign_key.column.table.name)
-                sub_instance = table.get_by_primary_key(value)
-                values.extend(table.values(sub_instance))
-        return values
-
-    def get_by_primary_key(self, value):
-        return self.get(**{self.primary_key.name: value}).first()
-
-    @property
-    def columns(self):
-        return self.declarative_meta.__table__.columns
-
-    @property
-    def recursive_columns(self):
-        return self.native_columns + self.foreign_columns
-
-    def recursive_column_names(self, translation_language=None):
-        processors = []
-
-        if len(set([column.table for column in self.recursive_columns])) > 1:
-            processors.append(lambda column: column.table.name + column.name)
-        else:
-            processors.append(lambda column: column.name)
-
-        processors.append(camel_to_normal)
-
-
-
-        names = []
-        for column in self.recursive_columns:
-            result = column
-            for processor in processors:
-                result = processor(result)
-            names.append(result)
-        return names
-
-    @property
-    def primary_key(self):
-        return inspect(self.declarative_meta).primary_key[0]
-
-    def get(self, **conditions):
-        query = select(self.declarative_meta)
-        where = []
-        for column_name, value in conditions.items():
-            where.append(getattr(self.declarative_meta, column_name) == value)
-        if where:
-            query = query.where(*where)
-        return DB.current_session.scalars(query)
+from .core import Table
+from .executor import executor, attach
+from .widgets import SmartScrollArea, SubStringSearch, LeftAlignedLayout
 
 
 class Selection:
@@ -139,7 +25,17 @@ class Selection:
         return rows + [row]
 
 
+def load_rows(table, count, after, patterns, case_sensitive, generation):
+    # лишняя строка показывает, есть ли следующая страница
+    instances = table.instances(count + 1, after, patterns, case_sensitive)
+    more = len(instances) > count
+    instances = instances[:count]
+    return instances, list(table.data(instances)), more, generation
+
+
 class TableWidget(QTableWidget):
+    loading_changed = pyqtSignal(bool)
+
     def __init__(self, table: Table):
         super().__init__()
 
@@ -149,38 +45,56 @@ class TableWidget(QTableWidget):
         self.flags = Qt.ItemIsSelectable | Qt.ItemIsEnabled
         self.selection_color = QColor(200, 250, 200)
         self.no_selection_color = QColor(255, 255, 255)
-        self.start = 0
+        self.start = None
+        self.pages = []
+        self.cached_rows = []  # показанные строки, выбор и страницы считаются только по ним
+        self.cache_generation = None
+        self.loading = False
+        self.more = False
         self.selected_rows = []
-        self.filter = lambda values: values
+        self.patterns = []
+        self.case_sensitive = False
         self.translation_language = None
         self.labels = self.table.recursive_column_names(self.translation_language)
-        self.update()
-
-    def update(self):
-        self.clicked.connect(self.update_selection)
         self.setColumnCount(len(self.labels))
         self.setHorizontalHeaderLabels(self.labels)
         self.verticalHeader().hide()
-        self.clearContents()
-        row_count = 0
-        self.setRowCount(row_count)
-        for i, instance in enumerate(self.table.instances(self.row_count)):
-            values = self.table.values(instance)
-            if self.filter(values):
-                row_count += 1
-                self.setRowCount(row_count)
-                self.instances.append(instance)
-                color = self.selection_color if i in self.selected_rows else self.no_selection_color
-                for j, value in enumerate(values):
-                    item = QTableWidgetItem(str(value))
+        self.clicked.connect(self.update_selection)
+        self.load()
+
+    def update(self):
+        rows = self.cached_rows
+        changed = len(rows) != self.rowCount()
+        self.setRowCount(len(rows))
+        for i, (instance, values) in enumerate(rows):
+            color = self.row_color(i)
+            for j, value in enumerate(values):
+                text = str(value)
+                item = self.item(i, j)
+                if item is None:
+                    item = QTableWidgetItem(text)
                     item.setFlags(self.flags)
+                    self.setItem(i, j, item)
+                    changed = True
+                elif item.text() != text:
+                    item.setText(text)
+                    changed = True
+                if item.background().color() != color:
                     item.setBackground(color)
-                    self.setItem(row_count - 1, j, item)
-            if row_count == self.row_count:
-                break
-        self.resizeColumnsToContents()
-        self.resizeRowsToContents()
-        self.fix_size()
+        if changed:
+            self.resizeColumnsToContents()
+            self.resizeRowsToContents()
+            self.fix_size()
+
+    def row_color(self, row):
+        return self.selection_color if row in self.selected_rows else self.no_selection_color
+
+    def paint_row(self, row):
+        color = self.row_color(row)
+        for j in range(self.columnCount()):
+            item = self.item(row, j)
+            if item is not None:
+                item.setBackground(color)
 
     def size_hint(self):
         height = self.horizontalHeader().height() + 2
@@ -198,12 +112,93 @@ class TableWidget(QTableWidget):
     def update_selection(self):
         item = self.currentItem()
         if item is not None:
+            previous = self.selected_rows
             self.selected_rows = self.selection(self.selected_rows, item.row())
-            self.update()
+            for row in set(previous).symmetric_difference(self.selected_rows):
+                self.paint_row(row)
+        self.refresh()
+
+    @property
+    def rows(self):
+        self.refresh()
+        return self.cached_rows
+
+    def refresh(self):
+        # после commit/rollback строки перечитываются в фоне, до ответа остаются показанные
+        if self.cache_generation != DB.generation and not self.loading:
+            self.reload()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+
+    def key(self, instance):
+        return getattr(instance, self.table.primary_key.name)
 
     @property
     def instances(self):
-        return self.table.instances(self.row_count)
+        return [instance for instance, values in self.cached_rows]
+
+    @property
+    def has_next_page(self):
+        return bool(self.rows) and self.more
+
+    @property
+    def has_previous_page(self):
+        return bool(self.pages)
+
+    def next_page(self):
+        instances = self.instances
+        if self.has_next_page:
+            self.pages.append(self.start)
+            self.start = self.key(instances[-1])
+            self.selected_rows = []
+            self.reload()
+
+    def previous_page(self):
+        if self.pages:
+            self.start = self.pages.pop()
+            self.selected_rows = []
+            self.reload()
+
+    def search(self, patterns):
+        self.patterns = patterns
+        self.start = None
+        self.pages = []
+        self.selected_rows = []
+        self.reload()
+
+    @property
+    def arguments(self):
+        return self.table, self.row_count, self.start, self.patterns, self.case_sensitive, DB.generation
+
+    def load(self):
+        # первая страница загружается сразу: формы выбирают в ней строку сразу после создания
+        self.loaded(load_rows(*self.arguments))
+
+    def reload(self):
+        self.loading = True
+        self.setDisabled(True)
+        self.loading_changed.emit(True)
+        executor.submit(self, load_rows, *self.arguments, callback=self.loaded, errback=self.failed)
+
+    def loaded(self, result):
+        instances, values, self.more, generation = result
+        selected = [self.key(instance) for instance in self.selected_instances]
+        self.cached_rows = list(zip(attach(instances), values))
+        self.cache_generation = generation
+        keys = [self.key(instance) for instance in self.instances]
+        self.selected_rows = [keys.index(key) for key in selected if key in keys]
+        self.loading = False
+        self.update()
+        self.setDisabled(False)
+        self.loading_changed.emit(False)
+
+    def failed(self, error):
+        self.loading = False
+        self.setDisabled(False)
+        self.loading_changed.emit(False)
+        QMessageBox.warning(self, 'Loading failed', f'Could not load {self.table.name}: {error}')
 
     @property
     def selected_instances(self):
@@ -211,13 +206,29 @@ class TableWidget(QTableWidget):
 
 
 class SearchableTableWidget(SmartScrollArea):
+    search_delay = 300
+
     def __init__(self, table_widget):
         self.table_widget = table_widget
         self.search = SubStringSearch(table_widget.columnCount(), table_widget.columnWidth)
-        super().__init__(self.search, table_widget)
-        self.search.connect_to(self.perform_search)
+        self.previous_button = QPushButton('<')
+        self.next_button = QPushButton('>')
+        self.loading = QLabel('Loading...')
+        self.loading.hide()
+        pagination = QWidget()
+        pagination.setLayout(LeftAlignedLayout(self.previous_button, self.next_button, self.loading))
+        pagination.layout().setContentsMargins(0, 0, 0, 0)
+        super().__init__(self.search, table_widget, pagination)
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.search_delay)
+        self.search_timer.timeout.connect(self.perform_search)
+        self.search.connect_to(lambda: self.search_timer.start())
+        self.previous_button.clicked.connect(self.previous_page)
+        self.next_button.clicked.connect(self.next_page)
+        self.table_widget.loading_changed.connect(self.update_loading)
         self.widget().layout().setSpacing(0)
-        self.update_size()
+        self.update_pagination()
 
     def update_size(self):
         size = self.widget().sizeHint()
@@ -225,6 +236,110 @@ class SearchableTableWidget(SmartScrollArea):
         self.setMinimumHeight(height)
         self.setMinimumHeight(height)
 
-    def perform_search(self):
-        self.table_widget.update_items(self.search.validate)
+    def next_page(self):
+        self.table_widget.next_page()
+
+    def previous_page(self):
+        self.table_widget.previous_page()
+
+    def update_loading(self, loading):
+        self.loading.setVisible(loading)
+        if not loading:
+            self.update_pagination()
+
+    def update_pagination(self):
+        self.previous_button.setEnabled(self.table_widget.has_previous_page)
+        self.next_button.setEnabled(self.table_widget.has_next_page)
         self.update_size()
+
+    def perform_search(self):
+        self.table_widget.search(self.search.patterns)
+
+
+class TableModel(QAbstractTableModel):
+    def __init__(self, table: Table, page_size=100):
+        super().__init__()
+        self.table = table
+        self.page_size = page_size
+        self.labels = self.table.recursive_column_names()
+        self.keys = []
+        self.values = []
+        self.patterns = []
+        self.exhausted = False
+        self.loading = False
+        self.generation = DB.generation
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.values)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.labels)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if index.isValid() and role == Qt.DisplayRole:
+            return str(self.values[index.row()][index.column()])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.labels[section]
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted and not self.loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if self.loading:
+            return
+        if self.generation != DB.generation:  # данные изменились: загрузка начинается заново
+            QTimer.singleShot(0, self.reset)
+            return
+        self.loading = True
+        after = self.keys[-1] if self.keys else None
+        executor.submit(
+            self, self.table.rows, self.page_size, after, self.patterns,
+            callback=self.fetched, errback=self.failed
+        )
+
+    def fetched(self, rows):
+        self.loading = False
+        self.exhausted = len(rows) < self.page_size
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self.values), len(self.values) + len(rows) - 1)
+            for key, values in rows:
+                self.keys.append(key)
+                self.values.append(values)
+            self.endInsertRows()
+
+    def failed(self, error):
+        self.loading = False
+        self.exhausted = True  # повтор - после нового поиска или изменения данных
+        QMessageBox.warning(QApplication.activeWindow(), 'Loading failed', f'Could not load {self.table.name}: {error}')
+
+    def refresh(self):
+        if self.generation != DB.generation:
+            self.reset()
+
+    def search(self, patterns):
+        self.patterns = patterns
+        self.reset()
+
+    def reset(self):
+        executor.cancel(self)
+        self.beginResetModel()
+        self.keys = []
+        self.values = []
+        self.exhausted = False
+        self.loading = False
+        self.generation = DB.generation
+        self.endResetModel()
+
+
+class TableView(QTableView):
+    def __init__(self, table: Table, page_size=100):
+        super().__init__()
+        self.setModel(TableModel(table, page_size))
+        self.verticalHeader().hide()
+        self.setSelectionBehavior(QTableView.SelectRows)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.model().refresh()
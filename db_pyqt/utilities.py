@@ -1,13 +1,8 @@
-from PyQt5.QtCore import pyqtSignal
-from PyQt5.QtWidgets import QWidget, QLabel, QLayout, QVBoxLayout, QHBoxLayout, QPushButton
-
-
-
 def snake_to_spaced(text):
     return text.repace
 
 
-def connect(signal: pyqtSignal, func, *args, **kwargs):
+def connect(signal, func, *args, **kwargs):
     signal.connect(lambda: func(*args, **kwargs))
 
 
@@ -168,6 +168,10 @@ class SubStringSearch(QWidget):
         for search in self.searches:
             search.textChanged.connect(func)
 
+    @property
+    def patterns(self):
+        return [search.text() for search in self.searches]
+
     def validate(self, values, registry_sensitive=False):
         if registry_sensitive:
             def matches(what, where):
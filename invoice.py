@@ -0,0 +1,195 @@
+import argparse
+import csv
+import datetime
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from sqlalchemy import select, func
+
+from database import DB
+from db_pyqt.core import Table
+from pdf import Canvas
+
+BATCH_SIZE = 1000
+
+
+def services_query(client_id, start, end):
+    order = Table('Order').declarative_meta
+    service_to_order = Table('ServiceToOrder').declarative_meta
+    service = Table('Service').declarative_meta
+    return select(service.Name, service.Price).select_from(order).join(
+        service_to_order, service_to_order.OrderId == order.Id
+    ).join(
+        service, service.Id == service_to_order.ServiceId
+    ).where(
+        order.ClientId == client_id, order.CreationDate >= start, order.CreationDate <= end
+    ).order_by(order.CreationDate, order.Id)
+
+
+def get_services(client_id, start, end):
+    query = services_query(client_id, start, end).execution_options(yield_per=BATCH_SIZE)
+    for name, price in DB.current_session.execute(query):
+        yield name, price
+
+
+def period_text(start, end):
+    return f'{start:%d.%m.%Y}-{end:%d.%m.%Y}'
+
+
+def save_to_csv(path, client_id, start, end):
+    total_price = 0
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['период для оплаты', period_text(start, end)])
+        writer.writerow(['услуга', 'цена'])
+        for name, price in get_services(client_id, start, end):
+            writer.writerow([name, price])
+            total_price += price
+        writer.writerow(['стоимость услуг общая', total_price])
+    return total_price
+
+
+def save_to_pdf(path, client_id, start, end):
+    canvas = Canvas(path)
+    total_price = 0
+    canvas.start_lines(f'период для оплаты: {period_text(start, end)}', 'список оказанных услуг и цен:')
+    for name, price in get_services(client_id, start, end):
+        if not canvas.line_fits(2):
+            canvas.draw_line(f'к переносу: {total_price}')
+            canvas.start_lines(f'перенос: {total_price}')
+        canvas.draw_line(f'{name} {price}')
+        total_price += price
+    if not canvas.line_fits():
+        canvas.start_lines(f'перенос: {total_price}')
+    canvas.draw_line('стоимость услуг общая: ' + str(total_price))
+    canvas.save()
+    return total_price
+
+
+WRITERS = {'csv': save_to_csv, 'pdf': save_to_pdf}
+
+
+def client_column(kind):
+    if kind == 'Client':
+        return Table('Client').primary_key
+    for column in Table(kind).columns:
+        for foreign_key in column.foreign_keys:
+            if foreign_key.column.table.name == 'Client':
+                return column
+
+
+def line_counts_query(kind, start, end):
+    order = Table('Order').declarative_meta
+    service_to_order = Table('ServiceToOrder').declarative_meta
+    service = Table('Service').declarative_meta
+    entity = Table(kind)
+    client = client_column(kind)
+    return select(entity.primary_key, client, func.count()).select_from(order).join(
+        entity.declarative_meta, client == order.ClientId
+    ).join(
+        service_to_order, service_to_order.OrderId == order.Id
+    ).join(
+        service, service.Id == service_to_order.ServiceId
+    ).where(
+        order.CreationDate >= start, order.CreationDate <= end
+    ).group_by(entity.primary_key, client).order_by(entity.primary_key)
+
+
+def render(path, client_id, start, end, extension):
+    with DB.session_scope():
+        return float(WRITERS[extension](path, client_id, start, end))
+
+
+class Batch:
+    manifest_name = 'manifest.json'
+
+    def __init__(self, kind, start, end, directory, extension='pdf', workers=None):
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.directory = directory
+        self.extension = extension
+        self.workers = workers or os.cpu_count()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, self.manifest_name)
+
+    def load_manifest(self):
+        manifest = {'kind': self.kind, 'start': str(self.start), 'end': str(self.end), 'done': {}, 'failed': {}}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding='utf-8') as file:
+                saved = json.load(file)
+            if all(saved.get(key) == manifest[key] for key in ('kind', 'start', 'end')):
+                saved.setdefault('failed', {})
+                return saved
+        return manifest
+
+    def save_manifest(self, manifest):
+        with open(self.manifest_path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, ensure_ascii=False, indent=1)
+        os.replace(self.manifest_path + '.tmp', self.manifest_path)
+
+    def file_name(self, entity_id):
+        return f'{self.kind}_{entity_id}.{self.extension}'
+
+    def jobs(self):
+        for entity_id, client_id, count in DB.current_session.execute(
+                line_counts_query(self.kind, self.start, self.end)):
+            yield self.file_name(entity_id), client_id, count
+
+    def run(self, progress=lambda done, total: None, cancelled=lambda: False):
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = self.load_manifest()
+        jobs = [job for job in self.jobs() if job[0] not in manifest['done']]
+        done = len(manifest['done'])
+        total = done + len(jobs)
+        progress(done, total)
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(self.workers, mp_context=context) as pool:
+            futures = {}
+            for name, client_id, count in jobs:
+                path = os.path.join(self.directory, name)
+                future = pool.submit(render, path, client_id, self.start, self.end, self.extension)
+                futures[future] = name, count
+            for future in as_completed(futures):
+                name, count = futures[future]
+                try:
+                    manifest['done'][name] = {'lines': count, 'total': future.result()}
+                    manifest['failed'].pop(name, None)
+                except Exception as error:  # счет остается в журнале и пересоздается при следующем запуске
+                    manifest['failed'][name] = repr(error)
+                self.save_manifest(manifest)
+                done += 1
+                progress(done, total)
+                if cancelled():
+                    for pending in futures:
+                        pending.cancel()
+                    break
+        return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Формирование счетов за период')
+    parser.add_argument('start', type=datetime.date.fromisoformat)
+    parser.add_argument('end', type=datetime.date.fromisoformat)
+    parser.add_argument('directory')
+    parser.add_argument('--kind', choices=['Client', 'Insurance'], default='Client')
+    parser.add_argument('--format', choices=list(WRITERS), default='pdf')
+    parser.add_argument('--workers', type=int)
+    arguments = parser.parse_args()
+
+    batch = Batch(arguments.kind, arguments.start, arguments.end, arguments.directory, arguments.format,
+                  arguments.workers)
+    with DB.session_scope():
+        manifest = batch.run(lambda done, total: print(f'{done}/{total}', end='\r', flush=True))
+    print(f'\nсчетов: {len(manifest["done"])}, ошибок: {len(manifest["failed"])}, журнал: {batch.manifest_path}')
+    for name, error in manifest['failed'].items():
+        print(f'{name}: {error}')
+    raise SystemExit(1 if manifest['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@ from PyQt5 import QtWidgets
 from PyQt5.QtGui import QIcon
 
 import menus
+from database import DB
 from db_pyqt import widgets
 from db_pyqt.utilities import connect
 
@@ -32,7 +33,9 @@ class MainWindow(widgets.Widget):
             self.login.lt.addWidget(timer)
 
     def try_to_enter(self):
-        user = self.login.try_to_enter()
+        self.login.try_to_enter(self.enter)
+
+    def enter(self, user):
         if user:
             menu = menus.User.get_by_type(user)
             connect(menu.exit.clicked, self.to_login_menu)
@@ -64,7 +67,9 @@ def main():
     window = MainWindow()
     window.show()
     sys.excepthook = except_hook
-    sys.exit(app.exec())
+    code = app.exec()
+    DB.dispose()
+    sys.exit(code)
 
 
 if __name__ == '__main__':
@@ -5,13 +5,14 @@ from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QPixmap
 from PyQt5.QtWidgets import QWidget, QVBoxLayout
 
+import auth
 import check
 import database
 
 import order
 from db_pyqt import widgets
-from db_pyqt.forms import View, ViewToEdit, Dialog, Form, Choose
-from db_pyqt.table import Table
+from db_pyqt.forms import ViewToEdit, Dialog, Form, Choose, Browse
+from db_pyqt.executor import executor, attach
 from db_pyqt.widgets import Captcha
 from report import Report
 
@@ -58,20 +59,33 @@ class Login(QWidget):
         mode = QtWidgets.QLineEdit().echoMode() if self.show_password.isChecked() else QtWidgets.QLineEdit.Password
         self.password.setEchoMode(mode)
 
-    def try_to_enter(self):
-        password = self.password.text()
-        login = self.login.text()
-        user = Table('User').get(Login=login, Password=password).first()
+    def try_to_enter(self, callback):
+        self.enter.setDisabled(True)
+        executor.submit(
+            self, auth.log_in, self.login.text(), self.password.text(),
+            callback=lambda result: callback(self.entered(*result)),
+            errback=self.failed
+        )
+
+    def failed(self, error):
+        self.enter.setDisabled(False)
+        self.error.setText(f'Ошибка подключения к базе данных: {error}')
+        self.error.show()
+
+    def entered(self, user, failures):
+        self.enter.setDisabled(False)
+        self.errors = failures
         if user is None:
+            self.error.setText('Вход временно заблокирован' if auth.locked(failures) else 'Неверные данные')
             self.error.show()
-            self.errors += 1
-            if self.errors >= 2:
+            if self.errors >= auth.CAPTCHA_AFTER:
                 for widget in self.login_widgets:
                     widget.hide()
                 self.layout().addWidget(self.captcha)
                 pass
         else:
             self.error.hide()
+            user = attach([user])[0]
         return user
 
     @property
@@ -106,9 +120,8 @@ class User(Menu):
         super().__init__(user)
         self.services = QtWidgets.QVBoxLayout()
         self.layout().addLayout(self.services)
-        for service_to_user in Table('ServiceToUser').get(UserId=user.Id):
-            service = Table('Service').get(Id=service_to_user.ServiceId).first()
-            self.add_service(service.Name)
+        for name in auth.Permissions.resolve(user)[1]:
+            self.add_service(name)
         self.add_service_dialog('Формировать отчет', Report)
 
     def add_service(self, name, connect_to=None):
@@ -123,8 +136,8 @@ class User(Menu):
 
     @staticmethod
     def get_by_type(user):
-        user_type = Table('UserType').get(Id=user.TypeId).first()
-        return globals()[user_type.Name](user)
+        type_name, _ = auth.Permissions.resolve(user)
+        return globals()[type_name](user)
 
 
 class EditClientMode(ViewToEdit):
@@ -139,13 +152,14 @@ class Technician(User):
     def __init__(self, user):
         super().__init__(user)
         self.add_service('Формировать заказ', lambda: order.CodeDialog(self).show())
+        self.add_service_dialog('Этикетки заказов за день', order.LabelSheet)
         self.add_service_dialog('Редактировать информацию о клиенте', lambda: EditClientMode('Client'))
 
 
 class Administrator(User):
     def __init__(self, user):
         super().__init__(user)
-        self.add_service_dialog('История входа', lambda: View('LastEnter'))
+        self.add_service_dialog('История входа', lambda: Browse('LastEnter'))
 
 
 class Bookkeeper(User):
@@ -153,3 +167,4 @@ class Bookkeeper(User):
         super().__init__(user)
         self.add_service('Формировать счет на услуги предприятию', lambda: check.LegalEntityCheck(self))
         self.add_service('Формировать счет на услуги частному лицу', lambda: check.PhysicalEntityCheck(self))
+        self.add_service_dialog('Формировать счета за период', check.BatchCheck)
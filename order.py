@@ -1,62 +1,77 @@
-import os
-import random
+import datetime
 
-from PIL.ImageDraw import ImageDraw
 from PyQt5 import QtWidgets
 from PyQt5.QtCore import Qt
-from PyQt5.QtWidgets import QFileDialog
-from reportlab.pdfgen.canvas import Canvas
-from sqlalchemy import func
-from PIL import Image
+from PyQt5.QtWidgets import QFileDialog, QWidget, QVBoxLayout, QDateEdit, QPushButton, QMessageBox
+from sqlalchemy import func, select
 
 import database
+from database import DB
 from db_pyqt import widgets
 from db_pyqt.forms import Add, Form, Dialog
 from db_pyqt.inputs import Input, UniqueInput
 from db_pyqt.table import Table
-
-
-class Bar:
-    def __init__(self, w, h, color):
-        self.w = w
-        self.h = h
-        self.color = color
+from pdf import Canvas, ean13
 
 
 class CodeDialog(widgets.Dialog):
     def __init__(self, parent):
         self.label = QtWidgets.QLabel('Введите код заказа:')
         self.code = UniqueInput(Table('Order').declarative_meta.Id)
-        super().__init__(parent, 'Код заказа', self.label, self.code.widget, self.code.error)
+        self.barcode_error = QtWidgets.QLabel()
+        self.barcode_error.hide()
+        super().__init__(parent, 'Код заказа', self.label, self.code.widget, self.code.error, self.barcode_error)
 
     def keyPressEvent(self, e) -> None:
         if e.key() == Qt.Key_Return:
+            try:
+                ean13(self.code.widget.value())
+            except ValueError as error:
+                self.barcode_error.setText(str(error))
+                self.barcode_error.show()
+                return
+            self.barcode_error.hide()
+            self.code.check_now()
+            if not self.code.validate():
+                return
             self.form_bar_code()
-            Dialog(Form(Add('Order', Id=self.code)), self.parent()).show()
+            Dialog(Form(Add('Order', bulk=['ServiceToOrder'], Id=self.code)), self.parent()).show()
             self.close()
 
     def form_bar_code(self):
         path = QFileDialog.getSaveFileName(self, filter='(*.pdf)')[0]
         if path:
-            w, h = 200, 100
-            img_file = 'test\\temp.png'
-
-            im = Image.new('RGB', (w, h), "white")
-            painter = ImageDraw(im)
-            for x in range(w):
-                color = random.choice(['black', 'white'])
-                painter.line([(x, 0), (x, h - 10)], color)
-            n = 13
-            per_digit = w / n
-            x = 0
-            name = ''
-            for _ in range(n):
-                digit = random.randint(0, 9)
-                name += str(digit)
-                painter.text((x, h - 10), str(digit), 'black')
-                x += per_digit
-            im.save(img_file)
-            canvas = Canvas(path)
-            canvas.drawImage(img_file, 0, canvas._pagesize[1] - h)
-            canvas.save()
-            os.remove(img_file)
+            try:
+                save_labels(path, [self.code.widget.value()])
+            except (OSError, ValueError) as error:  # заказ все равно можно оформить, этикетку - позже
+                QMessageBox.warning(self, 'Этикетка не сохранена', str(error))
+
+
+class LabelSheet(QWidget):
+    def __init__(self):
+        super().__init__()
+        QVBoxLayout(self)
+        self.date = QDateEdit()
+        self.button = QPushButton('Печатать этикетки')
+        self.button.clicked.connect(self.form)
+        self.layout().addWidget(self.date)
+        self.layout().addWidget(self.button)
+
+    def form(self):
+        path = QFileDialog.getSaveFileName(self, filter='(*.pdf)')[0]
+        if path:
+            save_labels(path, day_codes(self.date.date().toPyDate()))
+
+
+def day_codes(date):
+    order = Table('Order').declarative_meta
+    query = select(order.Id).where(
+        order.CreationDate >= date, order.CreationDate < date + datetime.timedelta(days=1)
+    ).order_by(order.Id)
+    return DB.current_session.scalars(query).all()
+
+
+def save_labels(path, codes):
+    canvas = Canvas(path)
+    canvas.draw_labels(codes)
+    canvas.save()
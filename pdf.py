@@ -1,69 +1,191 @@
+import functools
+import io
 import os
+from xml.sax.saxutils import escape
 
+from reportlab.graphics import renderPDF
+from reportlab.graphics.barcode import createBarcodeDrawing
 from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.utils import ImageReader
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
-from reportlab.platypus import Paragraph, Table, TableStyle
-from matplotlib import pyplot as plt
+from reportlab.platypus import Paragraph, LongTable, TableStyle
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
 from data import fonts
 
 FONT_NAME = 'FreeSans'
+TABLE_FONT_SIZE = 10
+CELL_PADDING = 12  # левый и правый отступы ячейки LongTable
+PLOT_DPI = 150
+PLOT_ASPECT = 0.75  # высота графика относительно ширины
+BARCODE_DIGITS = 12  # EAN-13 без контрольной цифры, ее добавляет reportlab
 
 font_path = os.path.join(fonts.__path__[0], FONT_NAME + '.ttf')
-pdfmetrics.registerFont(TTFont(FONT_NAME, font_path))
+
+
+@functools.cache
+def register_font():
+    pdfmetrics.registerFont(TTFont(FONT_NAME, font_path))
+    return FONT_NAME
+
+
+@functools.cache
+def cell_style():
+    return ParagraphStyle('Cell', fontName=register_font(), fontSize=TABLE_FONT_SIZE, leading=TABLE_FONT_SIZE * 1.2)
+
+
+@functools.cache
+def table_style():
+    return TableStyle([
+        ('FONT', (0, 0), (-1, -1), register_font(), TABLE_FONT_SIZE),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('INNERGRID', (0, 0), (-1, -1), 0.25, colors.black),
+        ('BOX', (0, 0), (-1, -1), 0.25, colors.black)
+    ])
+
+
+def cell(text, width):
+    if pdfmetrics.stringWidth(text, register_font(), TABLE_FONT_SIZE) > width - CELL_PADDING:
+        return Paragraph(escape(text), cell_style())
+    return text
+
+
+def split_lines(data):
+    for row in data:
+        columns = [str(value).split('\n') for value in row]
+        for i in range(max(map(len, columns), default=0)):
+            yield [lines[i] if i < len(lines) else '' for lines in columns]
+
+
+def check_digit(digits):
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(digits))
+    return str(-total % 10)
+
+
+def ean13(code):
+    value = str(code).strip()
+    if not value.isdigit() or len(value) > BARCODE_DIGITS + 1:
+        raise ValueError(f'Код {code} нельзя записать в EAN-13')
+    if len(value) == BARCODE_DIGITS + 1:
+        if check_digit(value[:-1]) != value[-1]:
+            raise ValueError(f'В коде {code} неверная контрольная цифра')
+        return value[:-1]
+    return value.zfill(BARCODE_DIGITS)
+
+
+def barcode(code, width, height):
+    return createBarcodeDrawing('EAN13', value=ean13(code), width=width, height=height, humanReadable=True)
 
 
 class Canvas(canvas.Canvas):
+    line_height = 20
+    margin = 40
+
     def __init__(self, path):
         super().__init__(path)
-        self.setFont(FONT_NAME, 15)
+        self.setFont(register_font(), 15)
+        self.line_y = None
 
-    def draw_table(self, data, x=0, y=0):
-        styles = getSampleStyleSheet()
-        style = styles['Normal']
-        style.fontName = FONT_NAME
+    def start_lines(self, *lines):
+        if self.line_y is not None:
+            self.showPage()
+            self.setFont(register_font(), 15)
+        self.line_y = self.top
+        for line in lines:
+            self.draw_line(line)
 
-        paragraphs = []
-        for row in data:
-            row_paragraphs = []
-            for value in row:
-                paragraph = Paragraph(str(value), style)
-                row_paragraphs.append(paragraph)
-            paragraphs.append(row_paragraphs)
+    @property
+    def top(self):
+        return self._pagesize[1] - self.margin
 
-        table = Table(paragraphs)
+    def line_fits(self, count=1):
+        return self.line_y is not None and self.line_y - (count - 1) * self.line_height >= self.margin
 
-        table.setStyle(TableStyle(
-            [('INNERGRID', (0, 0), (-1, -1), 0.25, colors.black), ('BOX', (0, 0), (-1, -1), 0.25, colors.black)]
-        ))
+    def draw_line(self, text):
+        if self.line_y is None:
+            self.start_lines()
+        self.drawString(self.margin, self.line_y, text)
+        self.line_y -= self.line_height
 
-        table.wrapOn(self, 0, 0)
-        table.drawOn(self, x, y)
+    def draw_table(self, data):
+        rows = list(split_lines(data))
+        if not rows:
+            return
+        width = self._pagesize[0] - 2 * self.margin
+        column_width = width / max(len(row) for row in rows)
+        table = LongTable(
+            [[cell(value, column_width) for value in row] for row in rows],
+            colWidths=[column_width] * max(len(row) for row in rows),
+            splitByRow=1
+        )
+        table.setStyle(table_style())
 
-    def draw_plot(self, x, Y, y_labels, x_label):
-        plt.xlabel(x_label)
-        for y, label in zip(Y, y_labels):
-            plt.plot(x, y, label=label)
-        plt.legend(loc='best')
-        img_path = self.temp_file_name('png')
-        plt.savefig(img_path)
-        px_per_inch = plt.rcParams['figure.dpi']  # pixel in inches
-        y_plot = self._pagesize[-1] - plt.figure().get_figheight() * px_per_inch
-        self.drawImage(img_path, 0, y_plot)
-        os.remove(img_path)
+        if self.line_y is None:
+            self.start_lines()
+        while table is not None:
+            available = self.line_y - self.margin
+            _, height = table.wrapOn(self, width, available)
+            if height <= available:
+                table.drawOn(self, self.margin, self.line_y - height)
+                self.line_y -= height + self.line_height
+                table = None
+                continue
+            parts = table.splitOn(self, width, available)
+            if len(parts) < 2:
+                if self.line_y == self.top:
+                    table.drawOn(self, self.margin, self.line_y - height)  # строка выше страницы
+                    table = None
+                self.start_lines()
+                continue
+            first, table = parts[0], parts[1]
+            _, height = first.wrapOn(self, width, available)
+            first.drawOn(self, self.margin, self.line_y - height)
+            self.start_lines()
 
-    @property
-    def directory(self):
-        return os.path.dirname(self._filename)
+    def draw_barcode(self, code, x, y, width, height):
+        renderPDF.draw(barcode(code, width, height), self, x, y)
+
+    def draw_labels(self, codes, columns=3, label_height=80, padding=10):
+        width = (self._pagesize[0] - 2 * self.margin) / columns
+        if self.line_y is None:
+            self.start_lines()
+        for i, code in enumerate(codes):
+            column = i % columns
+            if column == 0:
+                if self.line_y - label_height < self.margin:
+                    self.start_lines()
+                self.line_y -= label_height
+            x = self.margin + column * width
+            self.rect(x, self.line_y, width, label_height)
+            self.draw_barcode(code, x + padding, self.line_y + padding, width - 2 * padding, label_height - 2 * padding)
+
+    def draw_plot(self, x, Y, y_labels, x_label):
+        width = self._pagesize[0] - 2 * self.margin
+        height = width * PLOT_ASPECT
+        if self.line_y is None or self.line_y - height < self.margin:
+            self.start_lines()
+        image = render_plot(x, Y, y_labels, x_label, width / 72, height / 72)
+        self.drawImage(image, self.margin, self.line_y - height, width, height)
+        self.line_y -= height + self.line_height
 
-    def file_name(self, name_value, extension):
-        return os.path.join(self.directory, str(name_value) + '.' + extension)
 
-    def temp_file_name(self, extension):
-        i = 0
-        while os.path.exists(self.file_name(i, extension)):
-            i += 1
-        return self.file_name(i, extension)
\ No newline at end of file
+def render_plot(x, Y, y_labels, x_label, width, height):
+    figure = Figure(figsize=(width, height), dpi=PLOT_DPI)  # без pyplot: фигура не попадает в глобальное состояние
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.set_xlabel(x_label)
+    for y, label in zip(Y, y_labels):
+        axes.plot(x, y, label=label)
+    axes.legend(loc='best')
+    figure.tight_layout()
+    buffer = io.BytesIO()
+    try:
+        figure.savefig(buffer, format='png')
+    finally:
+        figure.clear()
+    buffer.seek(0)
+    return ImageReader(buffer)
@@ -0,0 +1,94 @@
+import argparse
+import hashlib
+import os
+import pickle
+import threading
+
+from sqlalchemy import MetaData, text
+
+directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'cache')
+
+FINGERPRINT_QUERIES = {
+    'mssql': 'SELECT COUNT(*), MAX(modify_date) FROM sys.objects WHERE is_ms_shipped = 0',
+    'sqlite': 'SELECT group_concat(sql) FROM sqlite_master',
+}
+
+
+def cache_path(engine):
+    key = hashlib.sha1(engine.url.render_as_string().encode('utf-8')).hexdigest()
+    return os.path.join(directory, key + '.pickle')
+
+
+def fingerprint(engine):
+    query = FINGERPRINT_QUERIES.get(engine.dialect.name)
+    if query is None:
+        return None
+    with engine.connect() as connection:
+        row = connection.execute(text(query)).one()
+    return hashlib.sha1(repr(tuple(row)).encode('utf-8')).hexdigest()
+
+
+def reflect(engine):
+    metadata = MetaData()
+    metadata.reflect(engine)
+    return metadata
+
+
+def save(engine, metadata, schema_fingerprint):
+    os.makedirs(directory, exist_ok=True)
+    path = cache_path(engine)
+    with open(path + '.tmp', 'wb') as file:
+        pickle.dump({'fingerprint': schema_fingerprint, 'metadata': metadata}, file)
+    os.replace(path + '.tmp', path)
+
+
+def load(engine):
+    path = cache_path(engine)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as file:
+            return pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+
+
+def rebuild(engine):
+    schema_fingerprint = fingerprint(engine)
+    metadata = reflect(engine)
+    save(engine, metadata, schema_fingerprint)
+    return metadata
+
+
+def refresh(engine, cached_fingerprint):
+    try:
+        if cached_fingerprint is None or fingerprint(engine) != cached_fingerprint:
+            rebuild(engine)
+    except Exception:
+        pass  # кэш остается прежним, проверка повторится при следующем запуске
+
+
+def load_metadata(engine):
+    cached = load(engine)
+    if cached is None:
+        return rebuild(engine)
+    threading.Thread(target=refresh, args=(engine, cached['fingerprint']), daemon=True).start()
+    return cached['metadata']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Кэш структуры базы данных')
+    parser.add_argument('command', choices=['rebuild', 'clear'])
+    arguments = parser.parse_args()
+
+    from database import DB
+
+    if arguments.command == 'rebuild':
+        metadata = rebuild(DB.engine)
+        print(f'{len(metadata.tables)} таблиц сохранено в {cache_path(DB.engine)}')
+    elif os.path.exists(cache_path(DB.engine)):
+        os.remove(cache_path(DB.engine))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import invoice
+from aggregation import DailyStatistics
+from database import DB
+from pdf import Canvas
+from rollup import Rollup, RollupStatistics
+
+REPRESENTATIONS = {'table': 'таблица', 'plot': 'график', 'both': 'график и таблица'}
+
+
+def refresh_rollup():
+    with DB.session_scope(), Rollup() as store:
+        store.refresh()
+
+
+def compute_series(start_date, end_date, use_rollup=True, distinct='exact', refresh=True):
+    if not use_rollup:
+        if distinct != 'exact':
+            raise ValueError('приблизительный подсчет доступен только по дневным итогам (use_rollup=True)')
+        statistics = DailyStatistics(start_date, end_date)
+        return np.arange(statistics.days), statistics.series()
+    with Rollup() as store:
+        if refresh:  # пакетный запуск обновляет итоги один раз до старта процессов, задания только читают
+            store.refresh()
+        statistics = RollupStatistics(start_date, end_date, store, distinct)
+        return np.arange(statistics.days), statistics.series()
+
+
+def services_data(start_date, end_date):
+    services = []
+    clients_per_services = []
+    clients = []
+    results = []
+    return {
+        'период': f'{start_date:%d.%m.%Y}-{end_date:%d.%m.%Y}',
+        'количество оказанных услуг': len(services),
+        'перечень услуг': '\n' + '\n'.join([service.name for service in services]),
+        'количетсво клиентов': len(clients),
+        'количество клиентов за день по каждой услуге': '\n' + '\n'.join(clients_per_services),
+        'средний результат каждого заказа в день': '\n' + '\n'.join(results)
+    }
+
+
+def services_report(path, start_date, end_date, representation='both', distinct='exact', refresh=True):
+    representation_type = REPRESENTATIONS.get(representation, representation)
+    data = services_data(start_date, end_date)
+    canvas = Canvas(path)
+    if 'таблица' in representation_type:
+        canvas.draw_table(data.items())
+    if 'график' in representation_type:
+        x, Y = compute_series(start_date, end_date, distinct=distinct, refresh=refresh)
+        y_labels = [list(data)[i] for i in (1, 3, 4, 5)]
+        canvas.draw_plot(x, Y, y_labels, 'Количество дней с начала промежутка ' + data['период'])
+    canvas.save()
+    return path
+
+
+def invoice_report(path, start_date, end_date, client_id):
+    extension = os.path.splitext(path)[1][1:]
+    invoice.WRITERS[extension](path, client_id, start_date, end_date)
+    return path
+
+
+REPORTS = {'services': services_report, 'invoice': invoice_report}
+
+
+def run(job):
+    job = dict(job)
+    report = REPORTS[job.pop('type')]
+    for key in ('start_date', 'end_date'):
+        if isinstance(job[key], str):
+            job[key] = datetime.date.fromisoformat(job[key])
+    with DB.session_scope():  # процессы пула переиспользуются, сессия не должна переживать задание
+        return report(**job)
+
+
+def run_many(jobs, workers=None, progress=lambda done, total: None):
+    context = multiprocessing.get_context('spawn')
+    failed = {}
+    if any(job['type'] == 'services' for job in jobs):
+        refresh_rollup()
+        jobs = [dict(job, refresh=False) if job['type'] == 'services' else job for job in jobs]
+    with ProcessPoolExecutor(workers or os.cpu_count(), mp_context=context) as pool:
+        futures = {pool.submit(run, job): job for job in jobs}
+        for done, future in enumerate(as_completed(futures), 1):
+            if future.exception() is not None:
+                failed[futures[future]['path']] = future.exception()
+            progress(done, len(futures))
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Формирование отчетов без графического интерфейса')
+    parser.add_argument('type', nargs='?', choices=list(REPORTS))
+    parser.add_argument('start_date', nargs='?', type=datetime.date.fromisoformat)
+    parser.add_argument('end_date', nargs='?', type=datetime.date.fromisoformat)
+    parser.add_argument('path', nargs='?')
+    parser.add_argument('--representation', choices=list(REPRESENTATIONS), default='both')
+    parser.add_argument('--distinct', choices=['exact', 'approximate'], default='exact',
+                        help='approximate - оценка числа клиентов и заказов через HyperLogLog')
+    parser.add_argument('--client', type=int, help='код клиента для счета')
+    parser.add_argument('--jobs', help='json со списком заданий для пакетного запуска')
+    parser.add_argument('--workers', type=int)
+    arguments = parser.parse_args()
+
+    if arguments.jobs:
+        with open(arguments.jobs, encoding='utf-8') as file:
+            jobs = json.load(file)
+        failed = run_many(jobs, arguments.workers, lambda done, total: print(f'{done}/{total}', end='\r', flush=True))
+        print(f'\nотчетов: {len(jobs) - len(failed)}, ошибок: {len(failed)}')
+        for path, error in failed.items():
+            print(f'{path}: {error!r}')
+        raise SystemExit(1 if failed else 0)
+
+    if None in (arguments.type, arguments.start_date, arguments.end_date, arguments.path):
+        parser.error('нужны тип отчета, период и путь или --jobs')
+    job = {'type': arguments.type, 'path': arguments.path,
+           'start_date': arguments.start_date, 'end_date': arguments.end_date}
+    if arguments.type == 'invoice':
+        if arguments.client is None:
+            parser.error('для счета нужен --client')
+        job['client_id'] = arguments.client
+    else:
+        job['representation'] = arguments.representation
+        job['distinct'] = arguments.distinct
+    print(run(job))
+
+
+if __name__ == '__main__':
+    main()
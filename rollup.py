@@ -0,0 +1,202 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+
+import numpy as np
+from sqlalchemy import select, func, make_url
+
+import reflection
+from aggregation import DailyStatistics, HyperLogLog, day, to_date
+from database import DB
+from db_pyqt.core import Table
+
+VERSION = 1  # при изменении схемы или HyperLogLog.precision история пересчитывается заново
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS watermark(name TEXT PRIMARY KEY, day TEXT);
+CREATE TABLE IF NOT EXISTS utilizations(day TEXT PRIMARY KEY, count INTEGER);
+CREATE TABLE IF NOT EXISTS clients(day TEXT PRIMARY KEY, count INTEGER);
+CREATE TABLE IF NOT EXISTS client_days(client INTEGER, day TEXT, PRIMARY KEY(client, day)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS order_days(order_id INTEGER, day TEXT, PRIMARY KEY(order_id, day)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS client_days_day ON client_days(day);
+CREATE INDEX IF NOT EXISTS order_days_day ON order_days(day);
+CREATE TABLE IF NOT EXISTS client_sketches(day TEXT PRIMARY KEY, registers BLOB);
+CREATE TABLE IF NOT EXISTS order_sketches(day TEXT PRIMARY KEY, registers BLOB);
+'''
+
+
+def store_path():
+    key = hashlib.sha1(make_url(DB.url).render_as_string().encode('utf-8')).hexdigest()
+    return os.path.join(reflection.directory, key + '.rollup.sqlite')
+
+
+def connect():
+    os.makedirs(reflection.directory, exist_ok=True)
+    connection = sqlite3.connect(store_path(), timeout=60, isolation_level=None)
+    connection.executescript(SCHEMA)
+    if connection.execute('PRAGMA user_version').fetchone()[0] != VERSION:
+        connection.execute('DELETE FROM watermark')
+        connection.execute(f'PRAGMA user_version = {VERSION}')
+    return connection
+
+
+def iso(value):
+    return to_date(value).isoformat()
+
+
+class Rollup:
+    # Дневные итоги отчета в локальном SQLite. Каждый источник пересчитывается с дня своей
+    # отметки (он мог быть неполным) и до конца, остальная история читается готовой.
+
+    def __init__(self):
+        self.connection = connect()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def watermark(self, name):
+        row = self.connection.execute('SELECT day FROM watermark WHERE name = ?', (name,)).fetchone()
+        return None if row is None else to_date(row[0])
+
+    def set_watermark(self, name, last_day):
+        self.connection.execute('INSERT OR REPLACE INTO watermark VALUES (?, ?)', (name, iso(last_day)))
+
+    def refresh(self):
+        self.connection.execute('BEGIN IMMEDIATE')  # параллельные процессы обновляют по очереди
+        try:
+            self.refresh_orders()
+            self.refresh_utilizations()
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+
+    def rebuild(self):
+        self.connection.execute('DELETE FROM watermark')  # следующий refresh пересчитает всю историю
+        self.refresh()
+
+    def refresh_orders(self):
+        order = Table('Order').declarative_meta
+        since = self.watermark('orders')
+        tail = '' if since is None else iso(since)
+        created = day(order.CreationDate)
+        query = select(created, order.ClientId).where(order.ClientId.is_not(None)).distinct()
+        if since is not None:
+            query = query.where(order.CreationDate >= since)
+        self.connection.execute('DELETE FROM client_days WHERE day >= ?', (tail,))
+        self.connection.execute('DELETE FROM clients WHERE day >= ?', (tail,))
+        pairs = [(client, iso(date)) for date, client in DB.current_session.execute(query)]
+        self.connection.executemany('INSERT OR IGNORE INTO client_days VALUES (?, ?)', pairs)
+        self.connection.execute(
+            'INSERT INTO clients SELECT day, COUNT(*) FROM client_days WHERE day >= ? GROUP BY day', (tail,)
+        )
+        self.store_sketches('client_sketches', pairs, tail)
+        if pairs:
+            self.set_watermark('orders', max(date for _, date in pairs))
+
+    def refresh_utilizations(self):
+        utilization = Table('Utilization').declarative_meta
+        service_to_order = Table('ServiceToOrder').declarative_meta
+        since = self.watermark('utilizations')
+        started = day(utilization.StartDatetime)
+        counts = select(started, func.count()).group_by(started)
+        orders = select(started, service_to_order.OrderId).join(
+            service_to_order, service_to_order.Id == utilization.ServiceToOrderId
+        ).distinct()
+        tail = '' if since is None else iso(since)
+        if since is not None:
+            counts = counts.where(utilization.StartDatetime >= since)
+            orders = orders.where(utilization.StartDatetime >= since)
+        self.connection.execute('DELETE FROM utilizations WHERE day >= ?', (tail,))
+        self.connection.execute('DELETE FROM order_days WHERE day >= ?', (tail,))
+        rows = [(iso(date), count) for date, count in DB.current_session.execute(counts)]
+        self.connection.executemany('INSERT INTO utilizations VALUES (?, ?)', rows)
+        pairs = [(order_id, iso(date)) for date, order_id in DB.current_session.execute(orders)]
+        self.connection.executemany('INSERT OR IGNORE INTO order_days VALUES (?, ?)', pairs)
+        self.store_sketches('order_sketches', pairs, tail)
+        if rows:
+            self.set_watermark('utilizations', max(date for date, _ in rows))
+
+    def store_sketches(self, table, pairs, tail):
+        self.connection.execute(f'DELETE FROM {table} WHERE day >= ?', (tail,))
+        if not pairs:
+            return
+        keys, days = zip(*pairs)
+        days, indices = np.unique(days, return_inverse=True)
+        sketches = HyperLogLog.sketches(np.array(keys, dtype=np.int64), indices, len(days))
+        self.connection.executemany(
+            f'INSERT INTO {table} VALUES (?, ?)', zip(days.tolist(), map(bytes, sketches))
+        )
+
+
+class RollupStatistics(DailyStatistics):
+    def __init__(self, start_date, end_date, rollup, distinct='exact'):
+        super().__init__(start_date, end_date)
+        self.rollup = rollup
+        self.distinct = distinct  # 'approximate' - оценка по сохраненным HyperLogLog вместо точного подсчета
+
+    def select(self, query):
+        return self.rollup.connection.execute(query, (iso(self.start_date), iso(self.end_date))).fetchall()
+
+    def read(self, query):
+        return self.bins(self.select(query))
+
+    def read_sketches(self, table):
+        rows = self.rollup.connection.execute(
+            f'SELECT day, registers FROM {table} WHERE day >= ? AND day < ? ORDER BY day',
+            (iso(self.start_date), iso(self.end_date))
+        )
+        sketches = (
+            ((to_date(date) - self.start_date).days, np.frombuffer(registers, dtype=np.uint8))
+            for date, registers in rows
+        )
+        return HyperLogLog.new_per_day(sketches, self.days)
+
+    def utilizations_per_day(self):
+        return self.read('SELECT day, count FROM utilizations WHERE day >= ? AND day < ?')
+
+    def clients_per_day(self):
+        return self.read('SELECT day, count FROM clients WHERE day >= ? AND day < ?')
+
+    def new_clients_per_day(self):
+        if self.distinct == 'approximate':
+            return self.read_sketches('client_sketches')
+        return self.read(
+            'SELECT first, COUNT(*) FROM (SELECT MIN(day) AS first FROM client_days '
+            'WHERE day >= ? AND day < ? GROUP BY client) GROUP BY first'
+        )
+
+    def new_orders_per_day(self):
+        if self.distinct == 'approximate':
+            return self.read_sketches('order_sketches')
+        return self.read(
+            'SELECT first, COUNT(*) FROM (SELECT MIN(day) AS first FROM order_days '
+            'WHERE day >= ? AND day < ? GROUP BY order_id) GROUP BY first'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Дневные итоги для отчетов')
+    parser.add_argument('command', choices=['refresh', 'rebuild', 'clear'])
+    arguments = parser.parse_args()
+
+    if arguments.command == 'clear':
+        if os.path.exists(store_path()):
+            os.remove(store_path())
+        return
+    with DB.session_scope(), Rollup() as rollup:
+        if arguments.command == 'rebuild':
+            rollup.rebuild()
+        else:
+            rollup.refresh()
+        print({name: str(rollup.watermark(name)) for name in ('orders', 'utilizations')})
+
+
+if __name__ == '__main__':
+    main()